@@ -0,0 +1,137 @@
+"""
+AWS API access for elb_lookup, in-process with boto3 instead of the aws CLI.
+
+One boto3 session is shared, and one client per service and region is
+created on first use and reused, so HTTPS connections are pooled across
+calls. Results are read page by page with the boto3 paginators, which
+follow the Marker and NextRecordName pagination, and are yielded as they
+arrive; the load balancers of several regions are listed at the same time.
+
+For offline tests, pass a session whose clients are stubbed with
+`botocore.stub.Stubber`, or run under moto.
+"""
+from typing import Iterator, List, Tuple
+import concurrent.futures
+import threading
+import queue
+import sys
+
+ELB_PAGE_SIZE = 400
+ROUTE53_REGION = 'us-east-1'
+
+
+def import_boto3():
+    try:
+        import boto3
+        import botocore.config
+    except ImportError:
+        raise ImportError('Reading from AWS needs the `boto3` package: pip3 install boto3')
+    return boto3, botocore.config
+
+
+def iter_concurrently(functions:list, workers:int) -> Iterator:
+    """
+    Runs generator functions on a thread pool and yields their items as they arrive.
+    """
+    items = queue.Queue(maxsize=workers * 4)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # a full queue is only waited on while the consumer is still reading
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(function):
+        try:
+            for item in function():
+                if not put(item):
+                    return
+        finally:
+            put(done)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(run, function) for function in functions]
+        running = len(futures)
+        try:
+            while running:
+                item = items.get()
+                if item is done:
+                    running -= 1
+                else:
+                    yield item
+        finally:
+            # on GeneratorExit or Ctrl-C, let the producers end so the pool can shut down
+            stop.set()
+            for future in futures:
+                future.cancel()
+        for future in futures:
+            future.result()
+
+
+class AWSClient:
+    """
+    Lists load balancers and Route53 record sets.
+
+    Args:
+        regions: Regions to list load balancers in; the session's region if empty.
+        profile: AWS profile name of the session, as for `aws --profile`.
+        session: A boto3 session to use instead of a new one, e.g. for tests.
+        max_pool_connections: HTTPS connections kept open per client.
+    """
+    def __init__(self, regions:List[str] = None, profile:str = None, session = None, max_pool_connections:int = 10):
+        boto3, config = import_boto3()
+        self.session = session or boto3.Session(profile_name=profile)
+        self.regions = regions or [self.session.region_name or ROUTE53_REGION]
+        self.config = config.Config(max_pool_connections=max_pool_connections,
+                                    retries={'mode': 'standard', 'max_attempts': 5})
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, service:str, region:str):
+        # creating clients from one session is not thread-safe; using them is
+        with self.lock:
+            if (service, region) not in self.clients:
+                self.clients[(service, region)] = self.session.client(service, region_name=region, config=self.config)
+            return self.clients[(service, region)]
+
+    def iter_load_balancers(self, errors:list = None) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yields the region, name and DNS name of every load balancer, page by page.
+        A region that fails is reported and skipped, and added to `errors` as ('region', region, message).
+        """
+        def list_region(region):
+            try:
+                paginator = self.get_client('elbv2', region).get_paginator('describe_load_balancers')
+                for page in paginator.paginate(PaginationConfig={'PageSize': ELB_PAGE_SIZE}):
+                    yield [(region, lb['LoadBalancerName'], lb['DNSName']) for lb in page['LoadBalancers']]
+            except Exception as e:
+                print('Error: listing load balancers in {} failed: {}'.format(region, e), file=sys.stderr)
+                if errors is not None:
+                    errors.append(('region', region, str(e)))
+
+        functions = [lambda region=region: list_region(region) for region in self.regions]
+        for page in iter_concurrently(functions, len(functions)):
+            yield from page
+
+    def iter_record_sets(self, zone_id:str) -> Iterator[dict]:
+        """
+        Yields the record sets of a hosted zone, page by page.
+        """
+        paginator = self.get_client('route53', ROUTE53_REGION).get_paginator('list_resource_record_sets')
+        for page in paginator.paginate(HostedZoneId=zone_id):
+            yield from page['ResourceRecordSets']
+
+    def iter_hosted_zones(self) -> Iterator[str]:
+        """
+        Yields the ID of every hosted zone of the account, page by page.
+        """
+        paginator = self.get_client('route53', ROUTE53_REGION).get_paginator('list_hosted_zones')
+        for page in paginator.paginate():
+            for zone in page['HostedZones']:
+                yield zone['Id'].rpartition('/')[2]
@@ -0,0 +1,188 @@
+"""
+Benchmark `elb_lookup.py -g` offline, on synthetic estates.
+
+Run As: $ benchmark.py -n 10,100,1000,10000 -o bench.json
+
+For each size, an estate of that many load balancers is generated with
+fake_estate.py and served by `fake_estate.FakeAWSClient` and a
+`fake_estate.FakeDNSServer`, each with its own latency and failure rate.
+No AWS account, network or boto3 is needed.
+
+The stages timed are get_all_load_balancer_dns_urls, do_nslookup (one
+lookup after another, on a sample of '--nslookup_sample' names),
+get_all_route53_dns (all zones, one after another) and generate (all zones),
+plus generate_zones end to end, as `-g all` runs it, with and without a
+warm DNS cache. Wall time, CPU time and the tracemalloc peak are printed as
+a table and, with '-o', saved as JSON; '--compare' prints the speedup of
+each stage against an earlier JSON result.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import resolver
+import dns_cache
+import fake_estate
+import elb_lookup
+
+PUBLIC_DNS = {'public_DNS': ['4.2.2.1', '8.8.8.8']}
+
+
+def go_parser():
+    parser = argparse.ArgumentParser(description = 'Benchmark elb_lookup on synthetic estates')
+    parser.add_argument('-n', '--sizes', action = 'store', dest = 'sizes', default = '10,100,1000,10000',
+                        help = 'Number(s) of load balancers per estate, separated by \',\' (default is 10,100,1000,10000)')
+    parser.add_argument('-r', '--repeat', action = 'store', dest = 'repeat', type = int, default = 3,
+                        help = 'Number of timed runs per stage; the fastest is kept (default is 3)')
+    parser.add_argument('-o', '--output', action = 'store', dest = 'output',
+                        help = 'Save the results to a file as JSON')
+    parser.add_argument('--compare', action = 'store', dest = 'compare',
+                        help = 'JSON result of an earlier run to compare against')
+    parser.add_argument('--no_memory', action = 'store_true',
+                        help = 'Skip the tracemalloc run of each stage')
+    parser.add_argument('--regions', action = 'store', dest = 'regions', type = int, default = 3,
+                        help = 'Number of regions the load balancers are spread over (default is 3)')
+    parser.add_argument('--zones', action = 'store', dest = 'zones', type = int, default = 4,
+                        help = 'Number of hosted zones (default is 4)')
+    parser.add_argument('--names_per_elb', action = 'store', dest = 'names_per_elb', type = int, default = 2,
+                        help = 'Alias records per load balancer (default is 2)')
+    parser.add_argument('--other_records', action = 'store', dest = 'other_records', type = int, default = 1,
+                        help = 'Records per load balancer that are not aliases (default is 1)')
+    parser.add_argument('--aws_latency', action = 'store', dest = 'aws_latency', type = float, default = 0.05,
+                        help = 'Seconds per page of AWS results (default is 0.05)')
+    parser.add_argument('--aws_failure', action = 'store', dest = 'aws_failure', type = float, default = 0.0,
+                        help = 'Rate of AWS page requests that fail and are retried (default is 0)')
+    parser.add_argument('--dns_latency', action = 'store', dest = 'dns_latency', type = float, default = 0.005,
+                        help = 'Seconds before each DNS answer (default is 0.005)')
+    parser.add_argument('--dns_drop', action = 'store', dest = 'dns_drop', type = float, default = 0.0,
+                        help = 'Rate of DNS queries left unanswered (default is 0)')
+    parser.add_argument('--nx_rate', action = 'store', dest = 'nx_rate', type = float, default = 0.0,
+                        help = 'Rate of load balancer names that do not resolve (default is 0)')
+    parser.add_argument('--dns_timeout', action = 'store', dest = 'dns_timeout', type = float, default = 0.5,
+                        help = 'Seconds the resolver waits for each DNS answer (default is 0.5)')
+    parser.add_argument('--dns_workers', action = 'store', dest = 'dns_workers', type = int, default = 32,
+                        help = 'Number of DNS lookups at the same time (default is 32)')
+    parser.add_argument('--zone_workers', action = 'store', dest = 'zone_workers', type = int, default = 4,
+                        help = 'Number of hosted zones fetched at the same time (default is 4)')
+    parser.add_argument('--nslookup_sample', action = 'store', dest = 'nslookup_sample', type = int, default = 100,
+                        help = 'Number of names looked up one by one for do_nslookup (default is 100)')
+    parser.add_argument('--seed', action = 'store', dest = 'seed', type = int, default = 0,
+                        help = 'Random seed of the estates (default is 0)')
+    args = parser.parse_args()
+
+    return args
+
+
+def measure(stage, repeat:int, memory:bool) -> tuple:
+    """
+    Runs a stage `repeat` times.
+
+    Returns:
+        Its result, the fastest wall and CPU time, and the tracemalloc peak
+        of one more run (None unless `memory`).
+    """
+    wall = cpu = None
+    for _ in range(max(repeat, 1)):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = stage()
+        wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        wall = wall_time if wall is None else min(wall, wall_time)
+        cpu = cpu_time if cpu is None else min(cpu, cpu_time)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, wall, cpu, peak
+
+
+def benchmark_size(elbs:int, server:fake_estate.FakeDNSServer, workdir:str, args) -> list:
+    estate = fake_estate.make_estate(elbs, args.regions, args.zones, args.names_per_elb, args.other_records,
+                                     args.nx_rate, args.seed)
+    client = fake_estate.FakeAWSClient(estate, args.aws_latency, args.aws_failure)
+    zone_ids = list(estate['zones'])
+    records = sum(len(record_sets) for record_sets in estate['zones'].values())
+
+    def new_resolver():
+        return resolver.Resolver([server.nameserver], args.dns_timeout, 2, args.dns_workers)
+
+    results = []
+    def run(name, stage, rows):
+        result, wall, cpu, peak = measure(stage, args.repeat, not args.no_memory)
+        results.append({'elbs': elbs, 'stage': name, 'rows': rows, 'wall_s': wall, 'cpu_s': cpu, 'peak_bytes': peak})
+        return result
+
+    # the stages report failed lookups and pages; keep the table readable
+    with contextlib.redirect_stdout(sys.stderr):
+        ip_address = run('get_all_load_balancer_dns_urls',
+                         lambda: elb_lookup.get_all_load_balancer_dns_urls(PUBLIC_DNS, client, new_resolver()), elbs)
+        urls = list(ip_address)[:args.nslookup_sample]
+        run('do_nslookup',
+            lambda: [elb_lookup.do_nslookup(PUBLIC_DNS['public_DNS'], url, new_resolver()) for url in urls], len(urls))
+        zones = run('get_all_route53_dns',
+                    lambda: [elb_lookup.get_all_route53_dns(client, zone_id) for zone_id in zone_ids], records)
+        run('generate', lambda: [elb_lookup.generate(zone, ip_address) for zone in zones], elbs + records)
+        run('generate_zones', lambda: elb_lookup.generate_zones(PUBLIC_DNS, client, ['all'], new_resolver(),
+                                                                args.zone_workers), elbs)
+
+        cache_file = os.path.join(workdir, 'dns_cache_{}.json'.format(elbs))
+        def cached_resolver():
+            return dns_cache.CachedResolver(cache_file, max(elbs, 1), 0, [server.nameserver], args.dns_timeout, 2,
+                                            args.dns_workers)
+        warm = cached_resolver()
+        elb_lookup.get_all_load_balancer_dns_urls(PUBLIC_DNS, client, warm)
+        warm.close()
+        def generate_zones_cached():
+            dns_resolver = cached_resolver()
+            result = elb_lookup.generate_zones(PUBLIC_DNS, client, ['all'], dns_resolver, args.zone_workers)
+            dns_resolver.close()
+            return result
+        run('generate_zones_cached', generate_zones_cached, elbs)
+    return results
+
+
+def print_results(results:list, baseline:dict):
+    print('{:>8} {:<32} {:>8} {:>10} {:>10} {:>10} {:>8}'.format('ELBs', 'Stage', 'Rows', 'Wall (s)', 'CPU (s)', 'Peak (MB)', 'Speedup'))
+    for r in results:
+        peak = '{:10.1f}'.format(r['peak_bytes'] / 1024 / 1024) if r['peak_bytes'] is not None else '{:>10}'.format('-')
+        old = baseline.get((r['elbs'], r['stage']))
+        ratio = '{:7.2f}x'.format(old['wall_s'] / r['wall_s']) if old and r['wall_s'] else '{:>8}'.format('-')
+        print('{:>8d} {:<32} {:>8d} {:10.4f} {:10.4f} {} {}'.format(r['elbs'], r['stage'], r['rows'], r['wall_s'], r['cpu_s'], peak, ratio))
+
+
+if __name__ == "__main__":
+
+    args = go_parser()
+    sizes = [int(n) for n in args.sizes.split(',')]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['elbs'], r['stage']): r for r in json.load(f)['results']}
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, \
+         fake_estate.FakeDNSServer(args.dns_latency, args.dns_drop) as server:
+        for elbs in sizes:
+            results += benchmark_size(elbs, server, workdir, args)
+            print('Finished {} ELBs'.format(elbs), file=sys.stderr)
+
+    print_results(results, baseline)
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key not in ('sizes', 'output', 'compare')}
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': settings,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,126 @@
+"""
+Persistent DNS cache for elb_lookup.
+
+Answers are kept in a JSON file (by default `dns_cache.json` next to
+`settings.txt`) until their record TTL runs out, so repeated runs only
+query names whose answers have expired. Names that do not exist are
+remembered for NEGATIVE_TTL seconds.
+
+With a stale window, an answer that expired less than that many seconds ago
+is still returned at once and refreshed in the background; the refresh is
+saved with the cache. The file holds at most `max_entries` names and drops
+the least recently used ones first.
+"""
+from typing import List, Tuple
+import concurrent.futures
+import collections
+import threading
+import json
+import time
+import sys
+import os
+import resolver
+
+FORMAT_VERSION = 1
+NEGATIVE_TTL = 60
+# for answers of the system resolver, which gives no TTL
+DEFAULT_TTL = 60
+
+
+class CachedResolver(resolver.Resolver):
+    """
+    A `resolver.Resolver` that answers from, and saves to, a cache file.
+
+    Args:
+        filename: The cache file; it is created by `close`.
+        max_entries: Maximum number of names kept in the file.
+        stale: Seconds after expiry during which an answer is still used while it is refreshed.
+    """
+    def __init__(self, filename:str, max_entries:int = 10000, stale:float = 0.0, nameservers:List[str] = None,
+                 timeout:float = 2.0, retries:int = 2, workers:int = 32):
+        super().__init__(nameservers, timeout, retries, workers)
+        self.filename = filename
+        self.max_entries = max_entries
+        self.stale = stale
+        self.entries = self.load()
+        self.lock = threading.Lock()
+        self.refreshing = {}
+        self.refresher = None
+        self.hits = self.stale_hits = self.misses = 0
+
+    def load(self) -> collections.OrderedDict:
+        try:
+            with open(self.filename) as f:
+                obj = json.load(f)
+        except (OSError, ValueError):
+            return collections.OrderedDict()
+        if obj.get('version') != FORMAT_VERSION:
+            return collections.OrderedDict()
+        return collections.OrderedDict(obj.get('entries', {}))
+
+    def query(self, name:str, qtype:int = resolver.TYPE_A) -> Tuple[List[str], int]:
+        key = name.rstrip('.').lower() if qtype == resolver.TYPE_A else '{}/{}'.format(name.rstrip('.').lower(), qtype)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+            if entry and now < entry['expires']:
+                self.hits += 1
+            elif entry and now < entry['expires'] + self.stale:
+                self.stale_hits += 1
+                if key not in self.refreshing:
+                    if not self.refresher:
+                        self.refresher = concurrent.futures.ThreadPoolExecutor(max_workers=max(self.workers, 1))
+                    self.refreshing[key] = self.refresher.submit(self.fetch, key, name, qtype)
+            else:
+                self.misses += 1
+                entry = None
+        if entry is None:
+            entry = self.fetch(key, name, qtype)
+        if entry.get('error'):
+            raise resolver.DNSError(entry['error'])
+        return entry['addresses'], max(int(entry['expires'] - now), 0)
+
+    def fetch(self, key:str, name:str, qtype:int) -> dict:
+        try:
+            addresses, ttl = super().query(name, qtype)
+            entry = {'addresses': addresses, 'expires': time.time() + (DEFAULT_TTL if ttl is None else ttl)}
+        except resolver.DNSError as e:
+            if str(e) != 'NXDOMAIN':
+                # keep a stale answer rather than an error that may pass
+                raise
+            entry = {'addresses': [], 'expires': time.time() + NEGATIVE_TTL, 'error': str(e)}
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+        return entry
+
+    def close(self) -> bool:
+        """
+        Waits for the background refreshes, then saves the cache file.
+
+        Returns:
+            True if the file was saved.
+        """
+        if self.refresher:
+            concurrent.futures.wait(self.refreshing.values())
+            self.refresher.shutdown()
+            self.refresher = None
+        self.refreshing = {}
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        temp_filename = '{}.{}.tmp'.format(self.filename, os.getpid())
+        try:
+            with open(temp_filename, 'w') as f:
+                json.dump({'version': FORMAT_VERSION, 'entries': self.entries}, f)
+            os.replace(temp_filename, self.filename)
+        except OSError as e:
+            print(e, file=sys.stderr)
+            return False
+        return True
+
+    def get_stats(self) -> str:
+        return 'DNS cache: {} hits, {} stale, {} misses ({} names in {})'.format(
+            self.hits, self.stale_hits, self.misses, len(self.entries), self.filename)
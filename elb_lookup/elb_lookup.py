@@ -1,8 +1,16 @@
-from typing import List
 import helper
+import resolver
+import dns_cache
+import ip_index
+import aws_client
+import os
+import re
+import sys
+import time
 import argparse
-import subprocess
-import json
+import ipaddress
+import concurrent.futures
+from typing import Iterator, List, Tuple
 
 
 def go_parser():
@@ -12,118 +20,158 @@ def go_parser():
     parser.add_argument('-a', '--add_dns', action = 'store_true',
                         help = 'Add IP to omit list.')    
     parser.add_argument('-g', '--generate', action = 'store', dest = 'zone_id',
-                        help = 'generate a URL list from elb_dns and route53_zone with IP addresseses and Zone names') 
+                        help = 'generate a URL list from elb_dns and route53_zone with IP addresseses and Zone names; zone IDs separated by \',\', or \'all\' for every hosted zone') 
+    parser.add_argument('--zone_workers', action = 'store', dest = 'zone_workers', type = int, default = 4,
+                        help = 'Number of hosted zones fetched at the same time (default is 4)')
     parser.add_argument('-o', '--output', action = 'store', dest = 'output_filename',
                     help = 'save to a file') 
+    parser.add_argument('--ndjson', action = 'store_true',
+                        help = 'Write one JSON record per line, to -o or stdout, as each zone arrives')
+    parser.add_argument('-d', '--diff', action = 'store_true',
+                        help = 'Only show the ELBs added, removed or changed since the last run with -d')
+    parser.add_argument('--snapshot', action = 'store', dest = 'snapshot',
+                        help = 'Snapshot file for -d (default is snapshot.ndjson next to settings.txt)')
+    parser.add_argument('--regions', action = 'store', dest = 'regions',
+                        help = 'AWS region(s) to list load balancers in, separated by \',\' (default is the profile\'s region)')
+    parser.add_argument('--profile', action = 'store', dest = 'profile',
+                        help = 'AWS profile to use, as for `aws --profile`')
+    parser.add_argument('--nameserver', action = 'store', dest = 'nameserver',
+                        help = 'DNS server(s) to query as host[:port], separated by \',\' (default is /etc/resolv.conf)')
+    parser.add_argument('--dns_timeout', action = 'store', dest = 'dns_timeout', type = float, default = 2.0,
+                        help = 'Seconds to wait for each DNS answer (default is 2)')
+    parser.add_argument('--dns_retries', action = 'store', dest = 'dns_retries', type = int, default = 2,
+                        help = 'Retries of a DNS query that timed out or failed (default is 2)')
+    parser.add_argument('--dns_workers', action = 'store', dest = 'dns_workers', type = int, default = 32,
+                        help = 'Number of DNS lookups at the same time (default is 32)')
+    parser.add_argument('--dns_cache', action = 'store', dest = 'dns_cache',
+                        help = 'DNS cache file (default is dns_cache.json next to settings.txt)')
+    parser.add_argument('--no_dns_cache', action = 'store_true',
+                        help = 'Resolve every name without the DNS cache')
+    parser.add_argument('--dns_cache_size', action = 'store', dest = 'dns_cache_size', type = int, default = 10000,
+                        help = 'Maximum number of names in the DNS cache (default is 10000)')
+    parser.add_argument('--dns_stale', action = 'store', dest = 'dns_stale', type = float, default = 0,
+                        help = 'Seconds an expired DNS answer is still used while it is refreshed (default is 0)')
+    parser.add_argument('--ip_index', action = 'store', dest = 'ip_index',
+                        help = 'IP index file that -g adds its IPs to (default is ip_index.db next to settings.txt)')
+    parser.add_argument('--no_ip_index', action = 'store_true',
+                        help = 'Do not add the result of -g to the IP index')
+    parser.add_argument('-f', '--find', action = 'store', dest = 'find',
+                        help = 'Find the ELBs and record names of IP(s) in the IP index, separated by \',\'')
     args = parser.parse_args()
 
     return args
 
 
 def add_DNS(public_dns_obj:dict, text:str) -> dict:
+    """
+    Adds IPv4/IPv6 addresses and CIDR ranges (e.g. '10.0.0.0/8'), separated by spaces or ',', to the omit list.
+    """
     if not text:
         print("Error: Input is empty!")
-        return False
+        return public_dns_obj
 
-    ip_address = helper.get_ipv4(text)
-    if not public_dns_obj['public_DNS']:
-        return ip_address
-    
-    for ip in ip_address:
-        if ip not in public_dns_obj['public_DNS']:
-            public_dns_obj['public_DNS'].append(ip)
+    stored = set(public_dns_obj['public_DNS'])
+    for entry in re.split(r'[\s,]+', text.strip()):
+        try:
+            network = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            print('Invalid IP address or range: {}'.format(entry))
+            continue
+        # a single address is stored without its prefix length
+        entry = str(network.network_address) if network.num_addresses == 1 and '/' not in entry else str(network)
+        if entry not in stored:
+            stored.add(entry)
+            public_dns_obj['public_DNS'].append(entry)
 
     return public_dns_obj
 
 
-def get_all_load_balancer_dns_urls(public_dns:dict, command:List) -> dict:
+def get_all_load_balancer_dns_urls(public_dns:dict, client:aws_client.AWSClient, dns_resolver:resolver.Resolver = None,
+                                   errors:list = None) -> dict:
     """
-    Gets all load balancer DNS URLs using `awscli`.
-    
+    Gets all load balancer DNS URLs from the AWS API, and resolves them concurrently.
+    Lookups start while later pages of load balancers are still being listed.
+
+    Args:
+        client: The AWS client to list the load balancers of its regions with.
+        dns_resolver: The resolver to use; a default `resolver.Resolver` if None.
+        errors: A list to add ('region', region, message) and ('dns', url, message) failures to.
+
     Returns:
         A dictionary of all load balancer DNS URLs and each corespondding IP.
+        URLs that fail to resolve are reported and map to an empty list.
     """
-    if not command:
+    if not client:
         return {}
-    
-    cmd_obj = {}
-    try:
-        output = subprocess.check_output(command)
-        cmd_obj = json.loads(output.decode())
-    except Exception as e:
-        print(e)
 
     # ELB URLs
-    urls = []
-    for i in range(len(cmd_obj)):
-        if cmd_obj[i][1] not in urls:
-            urls.append(cmd_obj[i][1])       
-    
+    def iter_urls():
+        seen = set()
+        for _, _, url in client.iter_load_balancers(errors):
+            if url not in seen:
+                seen.add(url)
+                yield url
 
+    dns_resolver = dns_resolver or resolver.Resolver()
+    omitted = helper.IPSet(public_dns['public_DNS'])
     ip_address = {}
-    for url in urls:
-        ipv4 = do_nslookup(public_dns['public_DNS'], url)
-        ip_address[url] = ipv4
+    for url, (ipv4, error) in dns_resolver.resolve_all(iter_urls()).items():
+        if error:
+            print('Error: DNS lookup of {} failed: {}'.format(url, error), file=sys.stderr)
+            if errors is not None:
+                errors.append(('dns', url, str(error)))
+        ip_address[url] = omitted.exclude(ipv4)
 
     return ip_address
 
 
-def do_nslookup(public_dns:list, url:str) -> list:
+def do_nslookup(public_dns:list, url:str, dns_resolver:resolver.Resolver = None) -> list:
     """
-    Performs an `nslookup` against the given load balancer DNS URL.
+    Looks up the IP addresses of the given load balancer DNS URL.
 
     Args:
-        url: The load balancer DNS URL to perform the `nslookup` against.
-        public_dns: Output should remove public DNS name servers.
+        url: The load balancer DNS URL to look up.
+        public_dns: Addresses and CIDR ranges to remove from the output, e.g. public DNS name servers.
+        dns_resolver: The resolver to use; a default `resolver.Resolver` if None.
 
     Returns:
-        The IP address of the load balancer without public DNS servers.
+        The IP address of the load balancer without public DNS servers,
+        or an empty list if the lookup failed.
     """
     if not url:
         return []
 
     try:
-        output = subprocess.check_output(["nslookup", url])
-    except Exception as e:
-        print(e)    
-    
-    ip_address = []
-    ipv4 = helper.get_ipv4(output)
-    if not ipv4:
+        ipv4 = (dns_resolver or resolver.Resolver()).resolve(url)
+    except resolver.DNSError as e:
+        print('Error: DNS lookup of {} failed: {}'.format(url, e), file=sys.stderr)
         return []
-    else:
-        for ip in ipv4:
-            if public_dns and ip not in public_dns:
-                ip_address.append(ip)
-        return ip_address
-    
 
-def get_all_route53_dns(command:List) -> dict:
-    if not command:
-        return False
+    return helper.IPSet(public_dns or []).exclude(ipv4)
     
-    py_obj = {}
-    try:
-        output = subprocess.check_output(command)
-        py_obj = json.loads(output.decode())
-    except Exception as e:
-        print(e)
-    #helper.go_pprint(py_obj, 2)
 
-    zones = {}
-    if len(py_obj['ResourceRecordSets']) < 1:
+def get_all_route53_dns(client:aws_client.AWSClient, zone_id:str, errors:list = None) -> dict:
+    """
+    Gets the alias records of a hosted zone from the AWS API, page by page.
+    A zone that fails is reported and added to `errors` as ('zone', zone_id, message).
+
+    Returns:
+        A dictionary of each alias target DNS name and the record names pointing to it.
+    """
+    if not client or not zone_id:
         return {}
-    else:
-        for i in range(len(py_obj['ResourceRecordSets'])):
-            if 'AliasTarget' in py_obj['ResourceRecordSets'][i].keys():
-                DNSName = py_obj['ResourceRecordSets'][i]['AliasTarget']['DNSName'][:-1]
-                Name = py_obj['ResourceRecordSets'][i]['Name']
-                if DNSName not in zones.keys():
-                    zones[DNSName] = [Name]
-                else:
-                    zones[DNSName].append(Name)
-        # helper.go_pprint(zones, 2)
-        return zones
+
+    zones = {}
+    try:
+        for record_set in client.iter_record_sets(zone_id):
+            if 'AliasTarget' in record_set:
+                DNSName = record_set['AliasTarget']['DNSName'][:-1]
+                zones.setdefault(DNSName, []).append(record_set['Name'])
+    except Exception as e:
+        print('Error: listing hosted zone {} failed: {}'.format(zone_id, e), file=sys.stderr)
+        if errors is not None:
+            errors.append(('zone', zone_id, str(e)))
+    return zones
 
 
 def generate(dict1:dict, dict2:dict) -> dict:
@@ -149,15 +197,139 @@ def generate(dict1:dict, dict2:dict) -> dict:
     return dns_dict
 
 
+def merge_result(result:dict, zone_result:dict) -> dict:
+    """
+    Merges the result of one hosted zone into the result of the zones before it.
+    """
+    for url, entry in zone_result.items():
+        if url not in result:
+            result[url] = entry
+        else:
+            result[url]['Names'] += [name for name in entry['Names'] if name not in result[url]['Names']]
+    return result
+
+
+def iter_generate_zones(public_dns:dict, client:aws_client.AWSClient, zone_ids:List[str],
+                        dns_resolver:resolver.Resolver = None, zone_workers:int = 4,
+                        errors:list = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Generates the result of many hosted zones in one pass.
+
+    The load balancers are listed and resolved once, while the record sets
+    of the zones are fetched, `zone_workers` zones at a time. Each zone is
+    joined with the load balancers as soon as it arrives.
+
+    Args:
+        zone_ids: Hosted zone IDs, or ['all'] for every hosted zone of the account.
+        errors: A list to add the failed regions, zones and DNS lookups to, as (kind, name, message),
+            so a partial result can be told from a changed estate.
+
+    Yields:
+        The zone ID and the `generate` result of each zone, in the order the zones arrive.
+    """
+    if zone_ids == ['all']:
+        try:
+            zone_ids = list(client.iter_hosted_zones())
+        except Exception as e:
+            print('Error: listing hosted zones failed: {}'.format(e), file=sys.stderr)
+            if errors is not None:
+                errors.append(('zone', 'all', str(e)))
+            return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(zone_workers, 1) + 1) as executor:
+        elb_future = executor.submit(get_all_load_balancer_dns_urls, public_dns, client, dns_resolver, errors)
+        zone_futures = {executor.submit(get_all_route53_dns, client, zone_id, errors): zone_id for zone_id in zone_ids}
+        elb_ip_address = elb_future.result()
+        for future in concurrent.futures.as_completed(zone_futures):
+            yield zone_futures[future], generate(future.result(), elb_ip_address)
+
+
+def generate_zones(public_dns:dict, client:aws_client.AWSClient, zone_ids:List[str],
+                   dns_resolver:resolver.Resolver = None, zone_workers:int = 4, errors:list = None) -> dict:
+    """
+    Returns:
+        The same dictionary as `generate`, with the names of all zones.
+    """
+    result = {}
+    for _, zone_result in iter_generate_zones(public_dns, client, zone_ids, dns_resolver, zone_workers, errors):
+        merge_result(result, zone_result)
+    return result
+
+
+def iter_records(result:dict, zone_id:str = None) -> Iterator[dict]:
+    """
+    Yields one flat record per ELB of a result, e.g. for NDJSON.
+    With `zone_id`, only the ELBs named in that zone are yielded, tagged with it.
+    """
+    for url, entry in result.items():
+        if zone_id is None:
+            yield {'ELB': url, 'Names': entry['Names'], 'IPs': entry['IPs']}
+        elif entry['Names']:
+            yield {'Zone': zone_id, 'ELB': url, 'Names': entry['Names'], 'IPs': entry['IPs']}
+
+
+def load_snapshot(filename:str) -> dict:
+    return {record['ELB']: {'Names': record['Names'], 'IPs': record['IPs']} for record in helper.iter_ndjson(filename)}
+
+
+def diff_results(old:dict, new:dict) -> dict:
+    """
+    Compares two results. Names and IPs are compared as sets, since DNS answers rotate.
+
+    Returns:
+        The 'added' and 'removed' ELBs with their entries, and the 'changed' ELBs
+        with the names and IPs added to and removed from each.
+    """
+    changes = {'added': {}, 'removed': {}, 'changed': {}}
+    for url, entry in new.items():
+        if url not in old:
+            changes['added'][url] = entry
+            continue
+        change = {}
+        for key in ('Names', 'IPs'):
+            old_values, new_values = set(old[url][key]), set(entry[key])
+            if old_values != new_values:
+                change[key] = {'added': sorted(new_values - old_values), 'removed': sorted(old_values - new_values)}
+        if change:
+            changes['changed'][url] = change
+    for url, entry in old.items():
+        if url not in new:
+            changes['removed'][url] = entry
+    return changes
+
+
+def carry_forward(result:dict, previous:dict, errors:list) -> int:
+    """
+    Keeps the IPs of the previous snapshot for ELBs whose DNS lookup failed,
+    so a failed lookup is not reported as removed IPs.
+
+    Returns:
+        The number of ELBs whose IPs were carried forward.
+    """
+    count = 0
+    for kind, url, _ in errors:
+        if kind == 'dns' and url in result and url in previous:
+            result[url]['IPs'] = previous[url]['IPs']
+            count += 1
+    return count
+
+
+def iter_change_records(changes:dict) -> Iterator[dict]:
+    for change in ('added', 'removed', 'changed'):
+        for url, entry in changes[change].items():
+            yield dict({'Change': change, 'ELB': url}, **entry)
+
 
 if __name__ == "__main__":
 
     args = go_parser()
     settings_file = 'settings.txt'
     public_dns_obj = helper.load_json(settings_file)
-    command = []
     route53_dns = {}
     load_balancer_dns_urls = {}
+    result = {}
+    changes = None
+    ip_index_file = args.ip_index or os.path.join(os.path.dirname(settings_file), 'ip_index.db')
 
     if args.list_dns:
         print('Current stored public DNS servers: {}'.format(', '.join([s for s in public_dns_obj['public_DNS']])))
@@ -170,20 +342,81 @@ if __name__ == "__main__":
             print('Error occurs at saving public DNS servers to file: {}'.format(settings_file))                
     
     if args.zone_id:
-        command = ["aws", "elbv2", "describe-load-balancers", "--query", "LoadBalancers[*].[LoadBalancerName,DNSName]"]
-        elb_ip_address = get_all_load_balancer_dns_urls(public_dns_obj, command)
-        #helper.go_pprint(elb_ip_address, 2)
- 
-        command = ["aws", "route53", "list-resource-record-sets", "--hosted-zone-id", args.zone_id, "--no-cli-pager"]
-        route53_dns = get_all_route53_dns(command)
-        #helper.go_pprint(route53_dns, 2)
-
-        result = generate(route53_dns, elb_ip_address)
-        if result:
+        nameservers = args.nameserver.split(',') if args.nameserver else None
+        if args.no_dns_cache:
+            dns_resolver = resolver.Resolver(nameservers, args.dns_timeout, args.dns_retries, args.dns_workers)
+        else:
+            dns_resolver = dns_cache.CachedResolver(
+                args.dns_cache or os.path.join(os.path.dirname(settings_file), 'dns_cache.json'),
+                args.dns_cache_size, args.dns_stale, nameservers, args.dns_timeout, args.dns_retries, args.dns_workers)
+        client = aws_client.AWSClient(args.regions.split(',') if args.regions else None, args.profile)
+        # NDJSON records are written as each zone arrives, unless only the changes are wanted
+        ndjson_file = None
+        errors = []
+        if args.ndjson and not args.diff:
+            ndjson_file = open(args.output_filename, 'w') if args.output_filename else sys.stdout
+        for zone_id, zone_result in iter_generate_zones(public_dns_obj, client, args.zone_id.split(','),
+                                                        dns_resolver, args.zone_workers, errors):
+            merge_result(result, zone_result)
+            if ndjson_file:
+                helper.write_ndjson(iter_records(zone_result, zone_id), ndjson_file)
+        if ndjson_file:
+            # ELBs that no record names
+            helper.write_ndjson(iter_records({url: entry for url, entry in result.items() if not entry['Names']}), ndjson_file)
+            if ndjson_file is not sys.stdout:
+                ndjson_file.close()
+        # stale answers were refreshed while Route53 was listed
+        if not args.no_dns_cache:
+            dns_resolver.close()
+            print(dns_resolver.get_stats(), file=sys.stderr)
+
+        if result and not args.no_ip_index:
+            try:
+                ip_index.update(ip_index_file, result)
+            except ip_index.sqlite3.Error as e:
+                print('Error: updating IP index {} failed: {}'.format(ip_index_file, e), file=sys.stderr)
+
+        if args.diff:
+            snapshot_file = args.snapshot or os.path.join(os.path.dirname(settings_file), 'snapshot.ndjson')
+            previous = load_snapshot(snapshot_file)
+            failed = sorted(set('{} {}'.format(kind, name) for kind, name, _ in errors if kind != 'dns'))
+            if failed:
+                # a partial listing would show the ELBs of the failed regions and zones as removed
+                print('Error: not compared with {}, which is kept, as listing failed: {}'.format(
+                    snapshot_file, ', '.join(failed)), file=sys.stderr)
+            else:
+                carry_forward(result, previous, errors)
+                changes = diff_results(previous, result)
+                if args.ndjson:
+                    if args.output_filename:
+                        helper.save_ndjson(iter_change_records(changes), args.output_filename)
+                    else:
+                        helper.write_ndjson(iter_change_records(changes), sys.stdout)
+                elif any(changes.values()):
+                    helper.go_pprint(changes, 4)
+                else:
+                    print('No changes since the last snapshot.')
+                if result:
+                    helper.save_ndjson(iter_records(result), snapshot_file)
+        elif not args.ndjson:
             helper.go_pprint(result, 4)
 
-    if args.output_filename:
+    if args.find:
+        conn = ip_index.connect(ip_index_file)
+        for ip in helper.get_ips(args.find.replace(',', ' ')):
+            owners = ip_index.lookup(conn, ip)
+            if not owners:
+                print('{}: not in {}'.format(ip, ip_index_file))
+            for owner in owners:
+                print('{}: {} {} (last seen {})'.format(ip, owner['ELB'], ', '.join(owner['Names']) or '-',
+                                                       time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(owner['Last Seen']))))
+        conn.close()
+
+    if args.output_filename and not args.ndjson:
         if not result:
             print("Error: please use `-g` to generate result.")
+        elif args.diff:
+            if changes is not None:
+                helper.save_json(changes, args.output_filename)
         else:
             helper.save_json(result, args.output_filename)
\ No newline at end of file
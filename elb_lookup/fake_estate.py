@@ -0,0 +1,237 @@
+"""
+Synthetic AWS estates and local stand-ins for AWS and DNS, for benchmarks and tests.
+
+An estate is a set of load balancers spread over regions, and hosted zones
+with alias records pointing at them. `FakeAWSClient` serves it through the
+same paginator calls `aws_client.AWSClient` makes to boto3, so the real
+listing code runs; `FakeDNSServer` answers A queries over UDP and TCP like
+a name server. Both take a latency and a failure rate.
+
+Run As: $ fake_estate.py --port 15353 --latency 0.01 --drop 0.05
+    Serves DNS answers on 127.0.0.1:15353, e.g. for `elb_lookup.py --nameserver 127.0.0.1:15353`.
+"""
+import multiprocessing
+import socketserver
+import threading
+import argparse
+import hashlib
+import random
+import struct
+import time
+import aws_client
+
+NX_PREFIX = 'nx-'
+ANSWER_TTL = 60
+ROUTE53_PAGE_SIZE = 300
+# retries of a throttled page, as in the retry config of aws_client
+MAX_ATTEMPTS = 5
+
+
+def go_parser():
+    parser = argparse.ArgumentParser(description = 'Fake DNS server for elb_lookup')
+    parser.add_argument('--port', action = 'store', dest = 'port', type = int, default = 15353,
+                        help = 'UDP and TCP port to answer on (default is 15353)')
+    parser.add_argument('--latency', action = 'store', dest = 'latency', type = float, default = 0.0,
+                        help = 'Seconds before each answer (default is 0)')
+    parser.add_argument('--drop', action = 'store', dest = 'drop', type = float, default = 0.0,
+                        help = 'Rate of UDP queries left unanswered (default is 0)')
+    args = parser.parse_args()
+
+    return args
+
+
+def make_estate(elbs:int, regions:int = 3, zones:int = 4, names_per_elb:int = 2, other_records:int = 1,
+                nx_rate:float = 0.0, seed:int = 0) -> dict:
+    """
+    Generates a synthetic estate.
+
+    Args:
+        elbs: Number of load balancers, spread evenly over the regions.
+        names_per_elb: Alias records per load balancer, spread over the zones.
+        other_records: Records per load balancer that are not aliases (CNAME, TXT).
+        nx_rate: Rate of load balancers whose DNS name does not resolve.
+
+    Returns:
+        {'load_balancers': {region: [(name, dns)]}, 'zones': {zone_id: [record set]}}
+    """
+    rng = random.Random(seed)
+    region_names = ['region-{}'.format(i) for i in range(max(regions, 1))]
+    zone_ids = ['Z{:012d}'.format(i) for i in range(max(zones, 1))]
+    estate = {'load_balancers': {region: [] for region in region_names},
+              'zones': {zone_id: [] for zone_id in zone_ids}}
+
+    for i in range(elbs):
+        region = region_names[i % len(region_names)]
+        name = 'elb-{}'.format(i)
+        prefix = NX_PREFIX if rng.random() < nx_rate else ''
+        dns = '{}{}-{:08x}.{}.elb.amazonaws.com'.format(prefix, name, rng.getrandbits(32), region)
+        estate['load_balancers'][region].append((name, dns))
+        for j in range(names_per_elb):
+            estate['zones'][rng.choice(zone_ids)].append({
+                'Name': 'app{}-{}.example.com.'.format(i, j), 'Type': 'A',
+                'AliasTarget': {'HostedZoneId': 'ZELB', 'DNSName': dns + '.', 'EvaluateTargetHealth': False}})
+        for j in range(other_records):
+            estate['zones'][rng.choice(zone_ids)].append({
+                'Name': 'www{}-{}.example.com.'.format(i, j), 'Type': 'CNAME', 'TTL': 300,
+                'ResourceRecords': [{'Value': 'app{}-0.example.com'.format(i)}]})
+    return estate
+
+
+class FakeAWSError(Exception):
+    pass
+
+
+class FakePaginator:
+    """
+    Serves pages of items, each after `latency` seconds. A page fails with
+    `failure_rate` and is retried, up to MAX_ATTEMPTS.
+    """
+    def __init__(self, items:list, key:str, page_size:int, latency:float, failure_rate:float):
+        self.items = items
+        self.key = key
+        self.page_size = page_size
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def paginate(self, PaginationConfig:dict = None, **kwargs):
+        page_size = (PaginationConfig or {}).get('PageSize', self.page_size)
+        for start in range(0, max(len(self.items), 1), page_size):
+            for _ in range(MAX_ATTEMPTS):
+                time.sleep(self.latency)
+                if random.random() >= self.failure_rate:
+                    break
+            else:
+                raise FakeAWSError('Throttling: Rate exceeded ({} attempts)'.format(MAX_ATTEMPTS))
+            yield {self.key: self.items[start:start + page_size]}
+
+
+class FakeZonePaginator:
+    # list_resource_record_sets pages through the zone given by HostedZoneId
+    def __init__(self, paginators:dict):
+        self.paginators = paginators
+
+    def paginate(self, HostedZoneId:str, **kwargs):
+        return self.paginators[HostedZoneId].paginate(**kwargs)
+
+
+class FakeServiceClient:
+    def __init__(self, paginators:dict):
+        self.paginators = paginators
+
+    def get_paginator(self, operation:str) -> FakePaginator:
+        return self.paginators[operation]
+
+
+class FakeAWSClient(aws_client.AWSClient):
+    """
+    An `aws_client.AWSClient` whose boto3 clients serve a synthetic estate; boto3 is not needed.
+
+    Args:
+        latency: Seconds per page of results.
+        failure_rate: Rate of page requests that fail and are retried.
+    """
+    def __init__(self, estate:dict, latency:float = 0.0, failure_rate:float = 0.0):
+        self.regions = list(estate['load_balancers'])
+        self.clients = {}
+        self.lock = threading.Lock()
+        for region, load_balancers in estate['load_balancers'].items():
+            items = [{'LoadBalancerName': name, 'DNSName': dns} for name, dns in load_balancers]
+            self.clients[('elbv2', region)] = FakeServiceClient({
+                'describe_load_balancers': FakePaginator(items, 'LoadBalancers', aws_client.ELB_PAGE_SIZE, latency, failure_rate)})
+        zones = [{'Id': '/hostedzone/' + zone_id} for zone_id in estate['zones']]
+        record_sets = {zone_id: FakePaginator(zone_record_sets, 'ResourceRecordSets', ROUTE53_PAGE_SIZE, latency, failure_rate)
+                       for zone_id, zone_record_sets in estate['zones'].items()}
+        self.clients[('route53', aws_client.ROUTE53_REGION)] = FakeServiceClient({
+            'list_hosted_zones': FakePaginator(zones, 'HostedZones', 100, latency, failure_rate),
+            'list_resource_record_sets': FakeZonePaginator(record_sets)})
+
+
+def build_answer(query:bytes) -> bytes:
+    """
+    Answers a DNS query: NXDOMAIN for names starting with NX_PREFIX, else two
+    A records derived from a hash of the name, so answers are stable.
+    """
+    query_id = struct.unpack('!H', query[:2])[0]
+    offset = 12
+    labels = []
+    while query[offset]:
+        length = query[offset]
+        labels.append(query[offset + 1:offset + 1 + length].decode(errors='replace'))
+        offset += length + 1
+    question = query[12:offset + 5]
+    name = '.'.join(labels).lower()
+    if name.startswith(NX_PREFIX):
+        return struct.pack('!HHHHHH', query_id, 0x8183, 1, 0, 0, 0) + question
+    digest = hashlib.md5(name.encode()).digest()
+    records = b''.join(b'\xc0\x0c' + struct.pack('!HHIH', 1, 1, ANSWER_TTL, 4) + bytes([10, digest[0], digest[1], i + 1])
+                       for i in range(2))
+    return struct.pack('!HHHHHH', query_id, 0x8180, 1, 2, 0, 0) + question + records
+
+
+class FakeDNSServer:
+    """
+    A DNS server on 127.0.0.1 in a separate process, so answering does not
+    compete with the resolver under test for the GIL.
+
+    Args:
+        latency: Seconds before each answer.
+        drop: Rate of UDP queries left unanswered, so the resolver times out and retries.
+    """
+    def __init__(self, latency:float = 0.0, drop:float = 0.0):
+        self.latency = latency
+        self.drop = drop
+        self.process = None
+        self.port = None
+
+    def __enter__(self) -> 'FakeDNSServer':
+        context = multiprocessing.get_context('spawn')
+        ports = context.Queue()
+        self.process = context.Process(target=serve, args=(0, self.latency, self.drop, ports), daemon=True)
+        self.process.start()
+        self.port = ports.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+    @property
+    def nameserver(self) -> str:
+        return '127.0.0.1:{}'.format(self.port)
+
+
+def serve(port:int, latency:float, drop:float, ports = None):
+    class UDPHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            data, sock = self.request
+            if random.random() < drop:
+                return
+            time.sleep(latency)
+            sock.sendto(build_answer(data), self.client_address)
+
+    class TCPHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            length = struct.unpack('!H', self.rfile.read(2))[0]
+            time.sleep(latency)
+            answer = build_answer(self.rfile.read(length))
+            self.wfile.write(struct.pack('!H', len(answer)) + answer)
+
+    socketserver.ThreadingUDPServer.daemon_threads = True
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    udp = socketserver.ThreadingUDPServer(('127.0.0.1', port), UDPHandler)
+    tcp = socketserver.ThreadingTCPServer(('127.0.0.1', udp.server_address[1]), TCPHandler)
+    threading.Thread(target=tcp.serve_forever, daemon=True).start()
+    if ports:
+        ports.put(udp.server_address[1])
+    udp.serve_forever()
+
+
+if __name__ == "__main__":
+
+    args = go_parser()
+    print('Answering DNS queries on 127.0.0.1:{}'.format(args.port))
+    try:
+        serve(args.port, args.latency, args.drop)
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,10 @@
-from typing import List
+from typing import Iterable, Iterator, List
+import ipaddress
+import bisect
 import pprint
 import json
+import sys
+import os
 import re
 
 def go_pprint(py_obj:object, depth:int) -> str:
@@ -8,25 +12,72 @@ def go_pprint(py_obj:object, depth:int) -> str:
     pp.pprint(py_obj)
 
 
-def go_validate_ipv4(octects:List) -> bool:
-    if len(octects) != 4:
-        return False
-    for oct in octects:
-        if not oct.isdigit() or int(oct) > 255 or int(oct) < 0:
-            return False
-    return True    
+# an address may end a sentence, but not be followed by another '.number'
+IP_PATTERN = re.compile(r'(?<![\w.:])(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9A-Fa-f]{0,4}(?::[0-9A-Fa-f]{0,4}){2,7}(?:(?:\.\d{1,3}){3})?)(?![\w:]|\.\d)')
 
 
-def get_ipv4(text) -> List[str]:
+def get_ips(text) -> List[str]:
+    """
+    Extracts the valid IPv4 and IPv6 addresses of a text in one pass, without duplicates, in order.
+    """
     if not text:
         return []
-    
-    pattern = re.compile(r'((\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3}))')
-    ipv4 = []
-    for match in pattern.findall(repr(text)):
-        if go_validate_ipv4(match[1:]) and match[0] not in ipv4:
-            ipv4.append(match[0])
-    return ipv4
+    if isinstance(text, bytes):
+        text = text.decode(errors='replace')
+
+    ips = {}
+    for match in IP_PATTERN.finditer(text):
+        try:
+            ips.setdefault(str(ipaddress.ip_address(match.group())), None)
+        except ValueError:
+            pass
+    return list(ips)
+
+
+class IPSet:
+    """
+    A set of IP addresses and CIDR ranges, IPv4 and IPv6 (e.g. '8.8.8.8', '10.0.0.0/8', '2001:db8::/32').
+
+    The entries are kept as sorted, merged intervals of integers per IP
+    version, so membership is a binary search, O(log n) in the number of
+    ranges. Invalid entries are reported and skipped.
+    """
+    def __init__(self, entries:Iterable[str] = ()):
+        intervals = {4: [], 6: []}
+        for entry in entries:
+            try:
+                network = ipaddress.ip_network(str(entry).strip(), strict=False)
+            except ValueError:
+                print('Invalid IP address or range: {}'.format(entry), file=sys.stderr)
+                continue
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self.starts = {}
+        self.ends = {}
+        for version, ranges in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.starts[version], self.ends[version] = starts, ends
+
+    def __contains__(self, address) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        value = int(ip)
+        i = bisect.bisect_right(self.starts[ip.version], value) - 1
+        return i >= 0 and value <= self.ends[ip.version][i]
+
+    def __len__(self) -> int:
+        return len(self.starts[4]) + len(self.starts[6])
+
+    def exclude(self, ips:Iterable[str]) -> List[str]:
+        return [ip for ip in ips if ip not in self]
 
 
 def load_json(filename:str) -> dict:
@@ -49,4 +100,46 @@ def save_json(py_obj:object, filename:str) -> bool:
     
     with open(filename, 'w') as f:
         json.dump(py_obj, f, indent=2)
-    return True
\ No newline at end of file
+    return True
+
+
+def write_ndjson(records:Iterable[dict], f) -> int:
+    """
+    Writes records to an open text file as NDJSON, one compact JSON object per line, as they are produced.
+    """
+    count = 0
+    for record in records:
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        count += 1
+    f.flush()
+    return count
+
+
+def save_ndjson(records:Iterable[dict], filename:str) -> bool:
+    if not filename:
+        print("No valid file name.", file=sys.stderr)
+        return False
+
+    # write to a temporary file first, so a failed run keeps the old file
+    temp_filename = filename + '.tmp'
+    try:
+        with open(temp_filename, 'w') as f:
+            write_ndjson(records, f)
+        os.replace(temp_filename, filename)
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return False
+    return True
+
+
+def iter_ndjson(filename:str) -> Iterator[dict]:
+    """
+    Reads the records of an NDJSON file one line at a time; a missing file has none.
+    """
+    try:
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    except FileNotFoundError:
+        return
@@ -0,0 +1,67 @@
+"""
+Reverse index of IP address to load balancer and Route53 record names.
+
+Every `-g` run adds the IPs of its result to a SQLite file (by default
+`ip_index.db` next to `settings.txt`), one row per IP and load balancer,
+with the time the pair was first and last seen. IPs that moved to another
+load balancer keep their older rows, so an address from an old capture can
+still be traced; rows not seen for MAX_AGE seconds are dropped.
+
+The IP is the primary key, so a lookup is a single B-tree search. The
+schema is also read by `ping_statistics.py --ip-index`.
+"""
+from typing import List
+import sqlite3
+import time
+import json
+
+MAX_AGE = 30 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ip_index (
+    ip TEXT NOT NULL,
+    elb TEXT NOT NULL,
+    names TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (ip, elb)
+) WITHOUT ROWID
+'''
+
+
+def connect(filename:str) -> sqlite3.Connection:
+    conn = sqlite3.connect(filename, timeout=60)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def update(filename:str, result:dict, now:float = None, max_age:float = MAX_AGE) -> int:
+    """
+    Adds the IPs of a `generate` result to the index, in one transaction.
+
+    Returns:
+        The number of IP and load balancer pairs seen in the result.
+    """
+    now = now or time.time()
+    rows = [(ip, url, json.dumps(entry['Names']), now, now) for url, entry in result.items() for ip in entry['IPs']]
+    conn = connect(filename)
+    try:
+        with conn:
+            conn.executemany('INSERT INTO ip_index VALUES (?, ?, ?, ?, ?) '
+                             'ON CONFLICT (ip, elb) DO UPDATE SET names = excluded.names, last_seen = excluded.last_seen',
+                             rows)
+            conn.execute('DELETE FROM ip_index WHERE last_seen < ?', (now - max_age,))
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def lookup(conn:sqlite3.Connection, ip:str) -> List[dict]:
+    """
+    Returns:
+        The load balancers an IP belonged to, most recently seen first, each with
+        its record names and the epoch times the pair was first and last seen.
+    """
+    rows = conn.execute('SELECT elb, names, first_seen, last_seen FROM ip_index WHERE ip = ? ORDER BY last_seen DESC', (ip,))
+    return [{'ELB': elb, 'Names': json.loads(names), 'First Seen': first_seen, 'Last Seen': last_seen}
+            for elb, names, first_seen, last_seen in rows]
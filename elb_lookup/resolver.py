@@ -0,0 +1,213 @@
+"""
+In-process DNS resolution for elb_lookup.
+
+A minimal stub resolver: A-record queries are sent over UDP straight to the
+name servers (from `/etc/resolv.conf` unless given), with a per-query
+timeout and retries, falling back to TCP for truncated answers. Many names
+are resolved at once on a bounded thread pool, and each name gets its own
+result or error, so one failed lookup does not stop the others.
+"""
+from typing import Iterable, List, Tuple
+import concurrent.futures
+import itertools
+import random
+import socket
+import struct
+
+TYPE_A = 1
+CLASS_IN = 1
+RCODES = {1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+
+class DNSError(Exception):
+    pass
+
+
+def get_nameservers(filename:str = '/etc/resolv.conf') -> List[str]:
+    nameservers = []
+    try:
+        with open(filename) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    nameservers.append(fields[1])
+    except OSError:
+        pass
+    return nameservers
+
+
+def build_query(name:str, query_id:int, qtype:int = TYPE_A) -> bytes:
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)
+    qname = b''.join(bytes([len(label)]) + label for label in name.rstrip('.').encode('idna').split(b'.')) + b'\x00'
+    return header + qname + struct.pack('!HH', qtype, CLASS_IN)
+
+
+def skip_name(data:bytes, offset:int) -> int:
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            # compression pointer
+            return offset + 2
+        offset += length + 1
+
+
+def parse_response(data:bytes, query_id:int, qtype:int = TYPE_A) -> Tuple[List[str], int, bool]:
+    """
+    Parses a DNS response.
+
+    Returns:
+        The addresses of the answer records of `qtype`, the lowest TTL of
+        those records, and whether the response was truncated.
+    """
+    if len(data) < 12:
+        raise DNSError('short response')
+    response_id, flags, qdcount, ancount = struct.unpack('!HHHH', data[:8])
+    if response_id != query_id or not flags & 0x8000:
+        raise DNSError('unexpected response')
+    truncated = bool(flags & 0x0200)
+    rcode = flags & 0x000F
+    if rcode:
+        raise DNSError(RCODES.get(rcode, 'RCODE {}'.format(rcode)))
+
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_name(data, offset) + 4
+    addresses = []
+    ttl = None
+    try:
+        for _ in range(ancount):
+            offset = skip_name(data, offset)
+            rtype, rclass, record_ttl, rdlength = struct.unpack('!HHIH', data[offset:offset + 10])
+            offset += 10
+            rdata = data[offset:offset + rdlength]
+            offset += rdlength
+            # CNAMEs are followed by the server; only the final records are kept
+            if rtype == qtype and rclass == CLASS_IN:
+                addresses.append(socket.inet_ntoa(rdata) if qtype == TYPE_A else socket.inet_ntop(socket.AF_INET6, rdata))
+                ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+    except (struct.error, IndexError, OSError, ValueError):
+        if not truncated:
+            raise DNSError('malformed response')
+    return addresses, ttl or 0, truncated
+
+
+class Resolver:
+    """
+    Resolves names against the given name servers ('host' or 'host:port').
+
+    Args:
+        nameservers: Name servers to query in turn; `/etc/resolv.conf` if empty.
+        timeout: Seconds to wait for each answer.
+        retries: Further attempts after a timeout or server failure.
+        workers: Number of names resolved at the same time by `resolve_all`.
+    """
+    def __init__(self, nameservers:List[str] = None, timeout:float = 2.0, retries:int = 2, workers:int = 32):
+        self.nameservers = [self.parse_server(s) for s in (nameservers or get_nameservers())]
+        self.timeout = timeout
+        self.retries = retries
+        self.workers = workers
+
+    @staticmethod
+    def parse_server(server:str) -> tuple:
+        host, _, port = server.rpartition(':') if server.count(':') == 1 else (server, '', '')
+        return (host, int(port)) if port else (server, 53)
+
+    def query(self, name:str, qtype:int = TYPE_A) -> Tuple[List[str], int]:
+        """
+        Queries the name servers for the records of a name.
+
+        Returns:
+            The addresses and their TTL in seconds (None from the system resolver).
+
+        Raises:
+            DNSError: The name does not exist, or no server answered after all retries.
+        """
+        if not self.nameservers:
+            return self.query_system(name), None
+
+        error = None
+        servers = itertools.cycle(self.nameservers)
+        for _ in range(self.retries + 1):
+            server = next(servers)
+            query_id = random.getrandbits(16)
+            try:
+                with socket.socket(socket.AF_INET6 if ':' in server[0] else socket.AF_INET, socket.SOCK_DGRAM) as s:
+                    s.settimeout(self.timeout)
+                    s.connect(server)
+                    s.send(build_query(name, query_id, qtype))
+                    while True:
+                        data = s.recv(4096)
+                        try:
+                            addresses, ttl, truncated = parse_response(data, query_id, qtype)
+                            break
+                        except DNSError as e:
+                            # a stray or late answer to an earlier query
+                            if str(e) != 'unexpected response':
+                                raise
+                if truncated:
+                    addresses, ttl = self.query_tcp(server, name, qtype)
+                return addresses, ttl
+            except socket.timeout:
+                error = DNSError('timed out')
+            except OSError as e:
+                error = DNSError(str(e))
+            except DNSError as e:
+                if str(e) == 'NXDOMAIN':
+                    raise
+                error = e
+        raise error
+
+    def query_tcp(self, server:tuple, name:str, qtype:int) -> Tuple[List[str], int]:
+        query_id = random.getrandbits(16)
+        message = build_query(name, query_id, qtype)
+        with socket.create_connection(server, timeout=self.timeout) as s:
+            s.sendall(struct.pack('!H', len(message)) + message)
+            length = struct.unpack('!H', self.recv_exact(s, 2))[0]
+            addresses, ttl, _ = parse_response(self.recv_exact(s, length), query_id, qtype)
+        return addresses, ttl
+
+    @staticmethod
+    def recv_exact(s:socket.socket, size:int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = s.recv(size - len(data))
+            if not chunk:
+                raise DNSError('connection closed')
+            data += chunk
+        return data
+
+    def query_system(self, name:str) -> List[str]:
+        # no name servers known: use the system resolver, without TTLs
+        error = None
+        for _ in range(self.retries + 1):
+            try:
+                infos = socket.getaddrinfo(name, None, socket.AF_INET, socket.SOCK_STREAM)
+                return list(dict.fromkeys(info[4][0] for info in infos))
+            except socket.gaierror as e:
+                if e.errno == socket.EAI_NONAME:
+                    raise DNSError('NXDOMAIN')
+                error = DNSError(str(e))
+        raise error
+
+    def resolve(self, name:str) -> List[str]:
+        return self.query(name)[0]
+
+    def resolve_all(self, names:Iterable[str]) -> dict:
+        """
+        Resolves many names concurrently.
+
+        Returns:
+            A dictionary of each name to a tuple of its addresses and its error (or None).
+        """
+        def resolve_one(name):
+            try:
+                return self.query(name)[0], None
+            except DNSError as e:
+                return [], e
+
+        # names may be a generator: each is submitted as soon as it is produced
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            futures = {name: executor.submit(resolve_one, name) for name in names}
+            return {name: future.result() for name, future in futures.items()}
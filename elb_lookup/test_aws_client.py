@@ -0,0 +1,121 @@
+"""
+Tests of aws_client: pagination with botocore Stubber, and iter_concurrently.
+
+Run As: $ python -m pytest elb_lookup
+"""
+import threading
+import time
+import pytest
+import aws_client
+
+REGIONS = ['us-east-1', 'eu-west-1']
+
+
+@pytest.fixture
+def client():
+    boto3 = pytest.importorskip('boto3')
+    session = boto3.Session(region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    return aws_client.AWSClient(REGIONS, session=session)
+
+
+def stub(client, service, region):
+    from botocore.stub import Stubber
+    stubber = Stubber(client.get_client(service, region))
+    stubber.activate()
+    return stubber
+
+
+def load_balancers(region, names):
+    return [{'LoadBalancerName': name, 'DNSName': '{}.{}.elb.amazonaws.com'.format(name, region)} for name in names]
+
+
+def test_iter_load_balancers_follows_markers(client):
+    for region in REGIONS:
+        stubber = stub(client, 'elbv2', region)
+        stubber.add_response('describe_load_balancers',
+                             {'LoadBalancers': load_balancers(region, ['a', 'b']), 'NextMarker': 'm1'},
+                             {'PageSize': aws_client.ELB_PAGE_SIZE})
+        stubber.add_response('describe_load_balancers',
+                             {'LoadBalancers': load_balancers(region, ['c'])},
+                             {'PageSize': aws_client.ELB_PAGE_SIZE, 'Marker': 'm1'})
+
+    found = sorted(client.iter_load_balancers())
+    assert found == sorted((region, name, '{}.{}.elb.amazonaws.com'.format(name, region))
+                           for region in REGIONS for name in 'abc')
+
+
+def test_iter_load_balancers_skips_failed_region(client):
+    stub(client, 'elbv2', REGIONS[0]).add_response(
+        'describe_load_balancers', {'LoadBalancers': load_balancers(REGIONS[0], ['a'])}, {'PageSize': aws_client.ELB_PAGE_SIZE})
+    stub(client, 'elbv2', REGIONS[1]).add_client_error('describe_load_balancers', 'AccessDenied')
+
+    errors = []
+    found = list(client.iter_load_balancers(errors))
+    assert [name for _, name, _ in found] == ['a']
+    assert [(kind, region) for kind, region, _ in errors] == [('region', REGIONS[1])]
+
+
+def test_iter_record_sets_follows_next_record(client):
+    stubber = stub(client, 'route53', aws_client.ROUTE53_REGION)
+    first = {'Name': 'a.example.com.', 'Type': 'A',
+             'AliasTarget': {'HostedZoneId': 'Z', 'DNSName': 'lb.elb.amazonaws.com.', 'EvaluateTargetHealth': False}}
+    second = {'Name': 'b.example.com.', 'Type': 'CNAME', 'TTL': 300, 'ResourceRecords': [{'Value': 'a.example.com'}]}
+    stubber.add_response('list_resource_record_sets',
+                         {'ResourceRecordSets': [first], 'IsTruncated': True, 'MaxItems': '1',
+                          'NextRecordName': 'b.example.com.', 'NextRecordType': 'CNAME'},
+                         {'HostedZoneId': 'Z1'})
+    stubber.add_response('list_resource_record_sets',
+                         {'ResourceRecordSets': [second], 'IsTruncated': False, 'MaxItems': '1'},
+                         {'HostedZoneId': 'Z1', 'StartRecordName': 'b.example.com.', 'StartRecordType': 'CNAME'})
+
+    assert list(client.iter_record_sets('Z1')) == [first, second]
+    stubber.assert_no_pending_responses()
+
+
+def test_iter_hosted_zones_strips_prefix(client):
+    stubber = stub(client, 'route53', aws_client.ROUTE53_REGION)
+    zones = [{'Id': '/hostedzone/Z{}'.format(i), 'Name': 'z{}.example.com.'.format(i), 'CallerReference': str(i)}
+             for i in range(2)]
+    stubber.add_response('list_hosted_zones',
+                         {'HostedZones': zones[:1], 'IsTruncated': True, 'NextMarker': 'Z1', 'Marker': '', 'MaxItems': '1'}, {})
+    stubber.add_response('list_hosted_zones',
+                         {'HostedZones': zones[1:], 'IsTruncated': False, 'Marker': 'Z1', 'MaxItems': '1'}, {'Marker': 'Z1'})
+
+    assert list(client.iter_hosted_zones()) == ['Z0', 'Z1']
+
+
+def test_iter_concurrently_yields_every_item():
+    functions = [lambda i=i: iter(range(i * 100, i * 100 + 50)) for i in range(5)]
+    assert sorted(aws_client.iter_concurrently(functions, 2)) == sorted(x for i in range(5) for x in range(i * 100, i * 100 + 50))
+
+
+def test_iter_concurrently_raises_producer_error():
+    def failing():
+        yield 1
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError, match='boom'):
+        list(aws_client.iter_concurrently([failing], 1))
+
+
+def test_iter_concurrently_stops_early():
+    stopped = []
+    lock = threading.Lock()
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            with lock:
+                stopped.append(True)
+
+    items = aws_client.iter_concurrently([endless] * 6, 2)
+    assert len([next(items) for _ in range(5)]) == 5
+    start = time.perf_counter()
+    items.close()
+    # the pool has shut down: the running producers ended, the waiting ones never started
+    assert time.perf_counter() - start < 2
+    assert len(stopped) == 2
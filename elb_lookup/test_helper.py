@@ -0,0 +1,28 @@
+"""
+Tests of helper: IP address extraction and IPSet.
+
+Run As: $ python -m pytest elb_lookup
+"""
+import helper
+
+
+def test_get_ips_at_end_of_sentence():
+    assert helper.get_ips('elb.example.com resolves to 8.8.8.8.') == ['8.8.8.8']
+    assert helper.get_ips('Addresses: 10.0.0.1, 2001:db8::1. Done') == ['10.0.0.1', '2001:db8::1']
+
+
+def test_get_ips_skips_longer_dotted_numbers():
+    assert helper.get_ips('version 1.2.3.4.5 and 1.2.3.4.') == ['1.2.3.4']
+    assert helper.get_ips(b'999.1.1.1 ::ffff:10.0.0.1') == ['::ffff:a00:1']
+
+
+def test_get_ips_without_duplicates_in_order():
+    assert helper.get_ips('10.0.0.2 10.0.0.1\n10.0.0.2') == ['10.0.0.2', '10.0.0.1']
+    assert helper.get_ips('') == []
+
+
+def test_ip_set():
+    ip_set = helper.IPSet(['10.0.0.0/8', '11.0.0.0/8', '8.8.8.8', '2001:db8::/32', 'not an address'])
+    assert len(ip_set) == 3
+    assert '11.255.0.1' in ip_set and '8.8.8.8' in ip_set and '2001:db8::1' in ip_set
+    assert ip_set.exclude(['8.8.4.4', '10.1.2.3', '2001:db9::1']) == ['8.8.4.4', '2001:db9::1']
@@ -0,0 +1,79 @@
+"""
+Tests of resolver.Resolver against fake_estate.FakeDNSServer.
+
+Run As: $ python -m pytest elb_lookup
+"""
+import pytest
+import resolver
+import fake_estate
+
+
+@pytest.fixture(scope='module')
+def server():
+    with fake_estate.FakeDNSServer() as server:
+        yield server
+
+
+@pytest.fixture(scope='module')
+def silent_server():
+    # drops every UDP query
+    with fake_estate.FakeDNSServer(drop=1.0) as server:
+        yield server
+
+
+def test_parse_response_of_built_query():
+    query = resolver.build_query('elb-1.example.com', 1234)
+    addresses, ttl, truncated = resolver.parse_response(fake_estate.build_answer(query), 1234)
+    assert len(addresses) == 2
+    assert ttl == fake_estate.ANSWER_TTL
+    assert not truncated
+
+
+def test_parse_response_rejects_other_id():
+    query = resolver.build_query('elb-1.example.com', 1234)
+    with pytest.raises(resolver.DNSError, match='unexpected response'):
+        resolver.parse_response(fake_estate.build_answer(query), 4321)
+
+
+def test_query(server):
+    addresses, ttl = resolver.Resolver([server.nameserver], timeout=1.0).query('elb-1.example.com')
+    assert len(addresses) == 2
+    assert all(address.startswith('10.') for address in addresses)
+    assert ttl == fake_estate.ANSWER_TTL
+
+
+def test_query_tcp(server):
+    dns_resolver = resolver.Resolver([server.nameserver], timeout=1.0)
+    addresses, ttl = dns_resolver.query_tcp(dns_resolver.nameservers[0], 'elb-1.example.com', resolver.TYPE_A)
+    assert addresses == dns_resolver.query('elb-1.example.com')[0]
+    assert ttl == fake_estate.ANSWER_TTL
+
+
+def test_nxdomain_is_not_retried(server):
+    with pytest.raises(resolver.DNSError, match='NXDOMAIN'):
+        resolver.Resolver([server.nameserver], timeout=1.0, retries=5).query(fake_estate.NX_PREFIX + 'elb.example.com')
+
+
+def test_timeout(silent_server):
+    dns_resolver = resolver.Resolver([silent_server.nameserver], timeout=0.1, retries=1)
+    with pytest.raises(resolver.DNSError, match='timed out'):
+        dns_resolver.query('elb-1.example.com')
+
+
+def test_resolve_all(server):
+    names = ['elb-{}.example.com'.format(i) for i in range(50)] + [fake_estate.NX_PREFIX + 'elb.example.com']
+    results = resolver.Resolver([server.nameserver], timeout=1.0, workers=8).resolve_all(iter(names))
+    assert list(results) == names
+    for name in names[:-1]:
+        addresses, error = results[name]
+        assert error is None
+        assert len(addresses) == 2
+    addresses, error = results[names[-1]]
+    assert addresses == []
+    assert str(error) == 'NXDOMAIN'
+
+
+def test_parse_server():
+    assert resolver.Resolver.parse_server('127.0.0.1:5353') == ('127.0.0.1', 5353)
+    assert resolver.Resolver.parse_server('127.0.0.1') == ('127.0.0.1', 53)
+    assert resolver.Resolver.parse_server('::1') == ('::1', 53)
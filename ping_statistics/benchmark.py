@@ -0,0 +1,195 @@
+'''
+Benchmark the stages of ping_statistics.py on synthetic captures.
+
+Features:
+1. Run As: $ benchmark.py -n 10000,100000,1000000 -o bench.json
+    1) Generates a synthetic capture per size with generate_capture.py.
+    2) Times every stage: read_ping_frm_file, countMissingPackets, getTimeout,
+       getPercentiles, getPacketsPerTimePeriod, convert_to_CSV and getGraph.
+2. Results
+    1) Wall time, CPU time and tracemalloc peak of each stage, per size.
+       Memory is measured in a separate run, so tracing does not skew the times.
+    2) Printed as a table and, with '-o [filename]', saved as JSON.
+3. Compare (--compare)
+    1) With '--compare [filename]', print the speedup of each stage against an earlier JSON result.
+4. Start-up (--startup)
+    1) Times new `python` processes that import ping_statistics, run a plain report (--no-graph)
+       and a report with the graph on a small capture, to check the cost of the imports.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import numpy
+import ping_statistics
+import generate_capture
+
+PERCENTILES = [50, 90, 99]
+TIMEOUT_PACKETS = 5
+TIME_PERIODS = [10, 60, 300, 3600]
+
+
+def go_parser():
+    parser = argparse.ArgumentParser(description = 'Benchmark the stages of ping_statistics.py')
+    parser.add_argument('-n', '--sizes', action = 'store', dest = 'sizes', default = '10000,100000,1000000',
+                        help = 'Input the number(s) of packets per capture, separated by \',\' (default is 10000,100000,1000000)')
+    parser.add_argument('-r', '--repeat', action = 'store', dest = 'repeat', type = int, default = 3,
+                        help = 'Input the number of timed runs per stage; the fastest is kept (default is 3)')
+    parser.add_argument('-o', '--output', action = 'store', dest = 'output',
+                        help = 'Input a filename to save the results to as JSON')
+    parser.add_argument('--compare', action = 'store', dest = 'compare',
+                        help = 'Input a JSON result of an earlier run to compare against')
+    parser.add_argument('--no-memory', action = 'store_true', dest = 'no_memory',
+                        help = 'Skip the tracemalloc run of each stage')
+    parser.add_argument('--no-graph', action = 'store_true', dest = 'no_graph',
+                        help = 'Skip convert_to_CSV and getGraph')
+    parser.add_argument('--startup', action = 'store_true',
+                        help = 'Also time the start-up of new ping_statistics.py processes')
+    args = parser.parse_args()
+    return args
+
+
+'''
+Run a stage `repeat` times, returning its result and the fastest wall and CPU time,
+plus the tracemalloc peak of one more run unless memory is False
+'''
+def measure(stage, repeat: int, memory: bool) -> tuple:
+    wall = cpu = None
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = stage()
+        wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        wall = wall_time if wall is None else min(wall, wall_time)
+        cpu = cpu_time if cpu is None else min(cpu, cpu_time)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, wall, cpu, peak
+
+
+def benchmark_size(packets: int, workdir: str, args) -> list:
+    capture = os.path.join(workdir, 'capture_{}.txt'.format(packets))
+    generate_capture.generate_capture(capture, packets, start_seq=60000)
+    input_bytes = os.path.getsize(capture)
+    rtt_name = os.path.join(workdir, 'rtt_{}'.format(packets))
+
+    results = []
+    def run(name, stage, rows):
+        result, wall, cpu, peak = measure(stage, args.repeat, not args.no_memory)
+        results.append({'packets': packets, 'stage': name, 'rows': rows, 'input_bytes': input_bytes,
+                        'wall_s': wall, 'cpu_s': cpu, 'peak_bytes': peak})
+        return result
+
+    seq, rtt, lost = run('read_ping_frm_file', lambda: ping_statistics.read_ping_frm_file(capture), packets)
+    sorted_seq = numpy.sort(seq)
+    run('countMissingPackets', lambda: ping_statistics.countMissingPackets(sorted_seq), seq.size)
+    run('getTimeout', lambda: ping_statistics.getTimeout(TIMEOUT_PACKETS, sorted_seq), seq.size)
+    run('getPercentiles', lambda: ping_statistics.getPercentiles(rtt, PERCENTILES), rtt.size)
+    periods = [p for p in TIME_PERIODS if p < sorted_seq[-1] - sorted_seq[0]]
+    run('getPacketsPerTimePeriod', lambda: ping_statistics.getPacketsPerTimePeriod(periods, sorted_seq), seq.size)
+    if not args.no_graph:
+        run('convert_to_CSV', lambda: ping_statistics.convert_to_CSV({capture: rtt}, rtt_name), rtt.size)
+        run('getGraph', lambda: ping_statistics.getGraph({capture: rtt}, rtt_name, auto_open=False), rtt.size)
+    return results
+
+
+'''
+CPU time of the finished child processes in seconds, or None without the
+`resource` module
+'''
+def getChildrenCPU():
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+'''
+Time whole ping_statistics.py processes on a small capture, where the
+start-up (interpreter and imports) is most of the cost
+'''
+def benchmark_startup(workdir: str, args) -> list:
+    packets = 1000
+    capture = os.path.join(workdir, 'capture_startup.txt')
+    generate_capture.generate_capture(capture, packets)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ping_statistics.py')
+    output = os.path.join(workdir, 'output.csv')
+    commands = {
+        'startup_import': [sys.executable, '-c', 'import ping_statistics'],
+        'startup_report': [sys.executable, script, capture, '--no-graph', '-o', output],
+        'startup_report_graph': [sys.executable, script, capture, '-g', os.path.join(workdir, 'rtt'), '-o', output],
+    }
+
+    results = []
+    for name, command in commands.items():
+        wall = cpu = None
+        for _ in range(args.repeat):
+            # the CPU time is spent in the child process
+            before = getChildrenCPU()
+            wall_start = time.perf_counter()
+            subprocess.run(command, cwd=os.path.dirname(script), check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wall_time = time.perf_counter() - wall_start
+            wall = wall_time if wall is None else min(wall, wall_time)
+            if before is not None:
+                cpu_time = getChildrenCPU() - before
+                cpu = cpu_time if cpu is None else min(cpu, cpu_time)
+        results.append({'packets': packets, 'stage': name, 'rows': packets, 'input_bytes': os.path.getsize(capture),
+                        'wall_s': wall, 'cpu_s': cpu, 'peak_bytes': None})
+    return results
+
+
+def print_results(results: list, baseline: dict):
+    print('{:>10} {:<24} {:>10} {:>10} {:>12} {:>8}'.format('Packets', 'Stage', 'Wall (s)', 'CPU (s)', 'Peak (MB)', 'Speedup'))
+    for r in results:
+        peak = '{:12.1f}'.format(r['peak_bytes'] / 1024 / 1024) if r['peak_bytes'] is not None else '{:>12}'.format('-')
+        old = baseline.get((r['packets'], r['stage']))
+        ratio = '{:7.2f}x'.format(old['wall_s'] / r['wall_s']) if old and r['wall_s'] else '{:>8}'.format('-')
+        cpu = '{:10.4f}'.format(r['cpu_s']) if r['cpu_s'] is not None else '{:>10}'.format('-')
+        print('{:>10d} {:<24} {:10.4f} {} {} {}'.format(r['packets'], r['stage'], r['wall_s'], cpu, peak, ratio))
+
+
+def main():
+    args = go_parser()
+    sizes = [int(n) for n in args.sizes.split(',')]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['packets'], r['stage']): r for r in json.load(f)['results']}
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.startup:
+            results += benchmark_startup(workdir, args)
+        for packets in sizes:
+            results += benchmark_size(packets, workdir, args)
+            print('Finished {} packets'.format(packets), file=sys.stderr)
+
+    print_results(results, baseline)
+    if args.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+'''
+On-disk cache of parsed ping captures.
+
+Each capture is stored as one .npy file per parsed array, named after a key
+built from the absolute path, size, mtime and a hash of the first and last
+64 KiB of the file (hashing a whole multi-GB capture would cost as much as
+parsing it). Arrays are loaded with memory-mapping, so a hit does not read
+the data until it is used.
+
+The cache is bounded by a total size; the least recently used captures are
+evicted first (a hit refreshes the mtime of its files).
+'''
+import os
+import hashlib
+import numpy
+
+SAMPLE_SIZE = 64 * 1024
+# bump when the parsed arrays change meaning, to ignore older entries
+FORMAT_VERSION = 2
+ARRAYS = ('seq', 'rtt', 'lost')
+
+
+'''
+Build the cache key of a capture file, or None if it cannot be read
+'''
+def get_key(filename: str):
+    try:
+        stat = os.stat(filename)
+        digest = hashlib.blake2b(digest_size=16)
+        with open(filename, 'rb') as f:
+            digest.update(f.read(SAMPLE_SIZE))
+            if stat.st_size > SAMPLE_SIZE:
+                f.seek(max(stat.st_size - SAMPLE_SIZE, SAMPLE_SIZE))
+                digest.update(f.read(SAMPLE_SIZE))
+    except OSError:
+        return None
+    identity = '{}|{}|{}|{}|{}'.format(FORMAT_VERSION, os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+def entry_paths(cache_dir: str, key: str) -> list:
+    return [os.path.join(cache_dir, '{}.{}.npy'.format(key, name)) for name in ARRAYS]
+
+
+'''
+Load the cached arrays of a key as read-only memory maps, or None on a miss
+'''
+def load(cache_dir: str, key: str):
+    if not key:
+        return None
+    paths = entry_paths(cache_dir, key)
+    try:
+        arrays = tuple(numpy.load(path, mmap_mode='r') for path in paths)
+        for path in paths:
+            os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return arrays
+
+
+'''
+Store the arrays of a key, then evict least recently used entries until
+the cache fits in max_bytes
+'''
+def save(cache_dir: str, key: str, arrays: tuple, max_bytes: int) -> bool:
+    if not key:
+        return False
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for path, array in zip(entry_paths(cache_dir, key), arrays):
+            tmp_path = path + '.{}.tmp'.format(os.getpid())
+            with open(tmp_path, 'wb') as f:
+                numpy.save(f, numpy.ascontiguousarray(array))
+            os.replace(tmp_path, path)
+    except OSError as e:
+        print(e)
+        return False
+    evict(cache_dir, max_bytes)
+    return True
+
+
+def evict(cache_dir: str, max_bytes: int):
+    entries = {}
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith('.npy'):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        key = entry.name.split('.', 1)[0]
+        size, last_used = entries.get(key, (0, 0))
+        entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime_ns))
+
+    total = sum(size for size, _ in entries.values())
+    for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total <= max_bytes:
+            break
+        for path in entry_paths(cache_dir, key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
@@ -0,0 +1,249 @@
+'''
+Collect ping statistics from many targets at once.
+
+Features:
+1. Run As: $ collector.py 4.2.2.1,8.8.8.8 -n 600 -p 50,99 -t 5
+    1) Runs `ping` against every target concurrently under asyncio; '--limit' caps the number running at once.
+    2) With '--tcp [port]', each probe times a TCP connect instead (no ICMP needed);
+       a connect that fails or takes longer than '--probe-timeout' counts as a lost packet.
+    3) '--targets-file' reads more targets, one per line.
+2. Live view
+    1) The output of every probe is parsed line by line as it arrives.
+    2) Every '--refresh' seconds, one line of rolling statistics per target is printed.
+    3) With '-t', alert on consecutive lost packets of a target as they happen.
+3. Report
+    1) When the probes end (or on Ctrl-C), every target gets the same report as ping_statistics.py,
+       with '-p', '-t', '--top', '-c', '-a' and '--ip-index', and the CSV output (-o).
+    2) With '--rollup [db]', every target is added to the rollup store, timed from the start of the probes.
+4. Archive (--archive [directory])
+    1) The raw output of every target is saved as [directory]/[target].txt, to be analyzed by ping_statistics.py later.
+'''
+import os
+import re
+import time
+import socket
+import asyncio
+import argparse
+import profiler
+import ping_statistics
+
+SEQ_MODULO = ping_statistics.SEQ_MODULO
+
+
+def go_parser():
+    parser = argparse.ArgumentParser(description = 'Collect ping statistics from many targets at once')
+    parser.add_argument('targets', nargs = '?', default = '',
+                        help = 'Input the host name(s) or IP address(es) to probe, separated by \',\' if more than one target.')
+    parser.add_argument('--targets-file', action = 'store', dest = 'targets_file',
+                        help = 'Input a file with more targets, one per line')
+    parser.add_argument('-n', '--packets', action = 'store', dest = 'packets', type = int, default = 0,
+                        help = 'Input the number of packets per target (default is 0, until Ctrl-C)')
+    parser.add_argument('-i', '--ping-interval', action = 'store', dest = 'ping_interval', type = float, default = 1.0,
+                        help = 'Input the seconds between packets of each target (default is 1)')
+    parser.add_argument('--limit', action = 'store', dest = 'limit', type = int, default = 100,
+                        help = 'Input the maximum number of ping processes, or TCP connects with --tcp, at the same time (default is 100)')
+    parser.add_argument('--tcp', action = 'store', dest = 'tcp', type = int,
+                        help = 'Input a port to probe with TCP connects instead of ping')
+    parser.add_argument('--probe-timeout', action = 'store', dest = 'probe_timeout', type = float, default = 1.0,
+                        help = 'Input the seconds after which a TCP connect counts as lost (default is 1)')
+    parser.add_argument('--ping-command', action = 'store', dest = 'ping_command', default = 'ping',
+                        help = 'Input the ping command to run, e.g. \'ping6\' (default is \'ping\')')
+    parser.add_argument('--archive', action = 'store', dest = 'archive',
+                        help = 'Input a directory to save the raw output of each target to')
+    parser.add_argument('--refresh', action = 'store', dest = 'refresh', type = float, default = 10.0,
+                        help = 'Input the seconds between the rolling statistics of the targets (default is 10)')
+    parser.add_argument('--window', action = 'store', dest = 'window', type = int, default = 60,
+                        help = 'Input the number of most recent packets for the rolling statistics (default is 60)')
+    parser.add_argument('-t', '--timeout', action = 'store', dest = 'timeout',
+                        help = 'Input a single integer for the maximum consecutive timeout.')
+    parser.add_argument('--top', action = 'store', dest = 'top', type = int,
+                        help = 'Input the number of longest outages to list')
+    parser.add_argument('-p', '--percentiles', action = 'store', dest = 'percentiles',
+                        help = 'Input value(s) (0-100), sepearted by \',\' if there is more than one value.')
+    parser.add_argument('-c', '--count', action = 'store', dest = 'count',
+                        help = 'Input number(s) for the duration of time period, sepearted by \',\' if more than one number')
+    parser.add_argument('-s', '--sliding', action = 'store_true',
+                        help = 'Count lost packets over sliding time periods that advance one packet at a time for -c')
+    parser.add_argument('-a', '--aggregate', action = 'store_true',
+                        help = 'Add an \'ALL\' result merged across the targets')
+    parser.add_argument('-o', '--output', action = 'store', dest = 'output', default = 'output.csv',
+                        help = 'Input the output filename (default is output.csv)')
+    parser.add_argument('--rollup', action = 'store', dest = 'rollup',
+                        help = 'Input a SQLite file to add per-minute and per-hour history of the targets to')
+    parser.add_argument('--ip-index', action = 'store', dest = 'ip_index',
+                        help = 'Input the IP index file of elb_lookup.py to name the ELB and records of each target')
+    # options of ping_statistics.py the report reads, with no use here
+    parser.set_defaults(range = None, save_sketch = None, target = None, start_time = None)
+    args = parser.parse_args()
+    return args
+
+
+def getTargets(args) -> list:
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    if args.targets_file:
+        with open(args.targets_file) as f:
+            targets += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    # keep the first of any repeated target
+    return list(dict.fromkeys(targets))
+
+
+'''
+Feed a line of output to the stream of its target, archive it and print its alert
+'''
+def feedLine(target: str, line: bytes, stream: ping_statistics.PingStream, archive):
+    if archive:
+        archive.write(line)
+    alert = stream.addLine(line)
+    if alert:
+        print(' {}: {}'.format(target, alert.strip()), flush=True)
+
+
+'''
+Run `ping` against a target and feed its output as it arrives
+'''
+async def runPing(target: str, args, stream: ping_statistics.PingStream, archive, limit: asyncio.Semaphore):
+    command = [args.ping_command, '-i', str(args.ping_interval), target]
+    if args.packets:
+        command[1:1] = ['-c', str(args.packets)]
+    async with limit:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        except OSError as e:
+            print(' {}: {}'.format(target, e), flush=True)
+            return
+        last_line = b''
+        try:
+            async for line in process.stdout:
+                feedLine(target, line, stream, archive)
+                last_line = line
+            await process.wait()
+            if process.returncode and stream.next_seq is None:
+                print(' {}: ping exited with {}: {}'.format(
+                    target, process.returncode, last_line.decode(errors='replace').strip()), flush=True)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+'''
+Time one TCP connect, returned as a line of ping output
+'''
+async def probeTcp(address: tuple, label: str, seq: int, timeout: float) -> bytes:
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(*address[:2]), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return 'Request timeout for icmp_seq {}\n'.format(seq % SEQ_MODULO).encode()
+    rtt = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return 'tcp connect to {}: icmp_seq={} time={:.3f} ms\n'.format(label, seq % SEQ_MODULO, rtt).encode()
+
+
+'''
+Probe a target with TCP connects every '--ping-interval' seconds.
+The name is resolved once, so the times do not include DNS lookups.
+'''
+async def runTcp(target: str, args, stream: ping_statistics.PingStream, archive, limit: asyncio.Semaphore):
+    loop = asyncio.get_running_loop()
+    try:
+        address = (await loop.getaddrinfo(target, args.tcp, type=socket.SOCK_STREAM))[0][4]
+    except OSError as e:
+        print(' {}: {}'.format(target, e), flush=True)
+        return
+    stream.address = address[0]
+    label = '{}:{}'.format(target, args.tcp)
+    start = loop.time()
+    seq = 0
+    while not args.packets or seq < args.packets:
+        # keep to the schedule, like ping does, when a connect is slow
+        await asyncio.sleep(max(start + seq * args.ping_interval - loop.time(), 0))
+        async with limit:
+            line = await probeTcp(address, label, seq, args.probe_timeout)
+        feedLine(target, line, stream, archive)
+        seq += 1
+
+
+'''
+Print one line of rolling statistics per target every `refresh` seconds
+'''
+async def printRolling(streams: dict, refresh: float):
+    while True:
+        await asyncio.sleep(refresh)
+        print(time.strftime('\n // %H:%M:%S //'))
+        for target, stream in streams.items():
+            print(' {} Seq {} |'.format(target, stream.getLastSeq())
+                  + stream.stats.getSummary().replace('\n', ' |'), flush=True)
+
+
+async def collect(targets: list, streams: dict, archives: dict, args):
+    limit = asyncio.Semaphore(args.limit)
+    probe = runTcp if args.tcp else runPing
+    refresher = asyncio.create_task(printRolling(streams, args.refresh))
+    try:
+        await asyncio.gather(*[probe(target, args, streams[target], archives.get(target), limit) for target in targets])
+    finally:
+        refresher.cancel()
+
+
+def main():
+    args = go_parser()
+    try:
+        targets = getTargets(args)
+    except OSError as e:
+        print(e)
+        return
+    if not targets:
+        print('Error: please input the target(s) or use `--targets-file`.')
+        return
+    if args.limit < 1 or args.window < 1 or args.refresh <= 0 or args.ping_interval <= 0:
+        print('[ Error on Limit, Window, Refresh or Interval Value ]')
+        return
+    if not args.tcp and not args.packets and len(targets) > args.limit:
+        # each ping holds its slot until it ends, so the rest would never start
+        print('[ Error: {} targets over a --limit of {} need -n ]'.format(len(targets), args.limit))
+        return
+    timeout_packets = int(args.timeout) if args.timeout and args.timeout.isnumeric() else 0
+
+    streams = {target: ping_statistics.PingStream(args.window, timeout_packets, keep=True) for target in targets}
+    archives = {}
+    if args.archive:
+        os.makedirs(args.archive, exist_ok=True)
+        for target in targets:
+            archives[target] = open(os.path.join(args.archive, re.sub(r'[^\w.-]', '_', target) + '.txt'), 'ab')
+    start_time = time.time()
+    try:
+        asyncio.run(collect(targets, streams, archives, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for archive in archives.values():
+            archive.close()
+
+    # Report, as for files
+    args.start_time = str(start_time)
+    stages = profiler.StageProfiler()
+    title = ''
+    lines = ''
+    sketches = {}
+    for target, stream in streams.items():
+        print('------------------\n {} \n------------------'.format(target))
+        target_title, target_lines, target_sketch = ping_statistics.analyzeCapture(stream.getCapture(target), args, stages)
+        title = title or target_title
+        lines += target_lines
+        if target_sketch:
+            sketches[target] = target_sketch
+    if args.aggregate and sketches:
+        report, all_title, all_lines = ping_statistics.aggregateSketches(sketches, args)
+        print(report, end='')
+        lines += all_lines
+    ping_statistics.output_to_file((title or ping_statistics.CSV_TITLE) + '\n' + lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+Generate a synthetic ping output file for testing and benchmarking.
+
+Features:
+1. Run As: $ generate_capture.py filename -n 1000000
+    1) Writes the output of a macOS-style `ping` with the requested number of packets.
+2. Loss patterns
+    1) '--loss' random loss rate of single packets.
+    2) '--burst-rate' and '--burst-length' start bursts of consecutive timeouts (outages).
+3. Disorder
+    1) '--reorder' rate of replies swapped with the next reply.
+    2) '--duplicate' rate of replies that are printed twice (DUP!).
+4. Sequence wraparound
+    1) '--start-seq' sets the first icmp_seq; icmp_seq wraps from 65535 to 0 like `ping` does.
+'''
+import argparse
+import numpy
+
+BATCH_SIZE = 100000
+
+
+def go_parser():
+    parser = argparse.ArgumentParser(description = 'Generate a synthetic ping output file')
+    parser.add_argument('filename',
+                        help = 'Input the name of the file to write the ping output to.')
+    parser.add_argument('-n', '--packets', action = 'store', dest = 'packets', type = int, default = 10000,
+                        help = 'Input the number of packets to send (default is 10000)')
+    parser.add_argument('--loss', action = 'store', dest = 'loss', type = float, default = 0.01,
+                        help = 'Input the rate of randomly lost packets (default is 0.01)')
+    parser.add_argument('--burst-rate', action = 'store', dest = 'burst_rate', type = float, default = 0.0005,
+                        help = 'Input the rate at which an outage starts at a packet (default is 0.0005)')
+    parser.add_argument('--burst-length', action = 'store', dest = 'burst_length', type = int, default = 30,
+                        help = 'Input the mean number of packets lost in an outage (default is 30)')
+    parser.add_argument('--reorder', action = 'store', dest = 'reorder', type = float, default = 0.001,
+                        help = 'Input the rate of replies arriving after the next reply (default is 0.001)')
+    parser.add_argument('--duplicate', action = 'store', dest = 'duplicate', type = float, default = 0.0005,
+                        help = 'Input the rate of duplicated replies (default is 0.0005)')
+    parser.add_argument('--start-seq', action = 'store', dest = 'start_seq', type = int, default = 0,
+                        help = 'Input the first icmp_seq; icmp_seq wraps at 65535 (default is 0)')
+    parser.add_argument('--seed', action = 'store', dest = 'seed', type = int, default = 0,
+                        help = 'Input the random seed (default is 0)')
+    args = parser.parse_args()
+    return args
+
+
+'''
+Write a synthetic capture and return a summary of what was generated.
+'''
+def generate_capture(filename: str, packets: int, loss: float = 0.01, burst_rate: float = 0.0005,
+                     burst_length: int = 30, reorder: float = 0.001, duplicate: float = 0.0005,
+                     start_seq: int = 0, seed: int = 0, host: str = '4.2.2.1') -> dict:
+    rng = numpy.random.default_rng(seed)
+
+    # lost packets: random single losses plus bursts
+    lost = rng.random(packets) < loss
+    burst_starts = numpy.flatnonzero(rng.random(packets) < burst_rate)
+    burst_lengths = rng.geometric(1 / max(burst_length, 1), burst_starts.size)
+    for start, length in zip(burst_starts.tolist(), burst_lengths.tolist()):
+        lost[start:start + length] = True
+    # keep the first and last packet so the capture has a defined span
+    lost[0] = lost[-1] = False
+
+    rtt = rng.lognormal(numpy.log(50), 0.5, packets)
+    order = numpy.arange(packets)
+    swaps = numpy.flatnonzero(rng.random(packets - 1) < reorder)
+    # a packet can only move once
+    swaps = swaps[numpy.diff(swaps, prepend=-2) > 1]
+    order[swaps], order[swaps + 1] = order[swaps + 1], order[swaps]
+    duplicated = rng.random(packets) < duplicate
+
+    with open(filename, 'w') as f:
+        f.write('PING {0} ({0}): 56 data bytes\n'.format(host))
+        for batch_start in range(0, packets, BATCH_SIZE):
+            rows = []
+            for i in order[batch_start:batch_start + BATCH_SIZE].tolist():
+                seq = (start_seq + i) % 65536
+                if lost[i]:
+                    rows.append('Request timeout for icmp_seq {}\n'.format(seq))
+                    continue
+                row = '64 bytes from {}: icmp_seq={} ttl=53 time={:.3f} ms\n'.format(host, seq, rtt[i])
+                rows.append(row)
+                if duplicated[i]:
+                    rows.append(row[:-1] + ' (DUP!)\n')
+            f.write(''.join(rows))
+
+    return {
+        'packets': packets,
+        'lost': int(lost.sum()),
+        'outages': int(burst_starts.size),
+        'reordered': int(swaps.size),
+        'duplicated': int((duplicated & ~lost).sum()),
+    }
+
+
+def main():
+    args = go_parser()
+    summary = generate_capture(args.filename, args.packets, args.loss, args.burst_rate, args.burst_length,
+                               args.reorder, args.duplicate, args.start_seq, args.seed)
+    print('Generated {}: {}'.format(args.filename, ', '.join('{} {}'.format(v, k) for k, v in summary.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ Features:
 1. Run As: $ ping_statistics.py filename1,filename2
     1) Takes one or more filenames as default requirement.
     2) Filenames are seperated by ','
+    3) gzip, bzip2, xz and zstd files are decompressed on the fly; '-' reads from STDIN.
 
 2. Pakcets Count & RTT
     1) # of packets transmitted 
@@ -24,17 +25,21 @@ Features:
     1) List lost-packet counts per requested consecutive-timeout period.
     2) e.g. With '-t 5', it'd display the total lost-packet counts which is larger than 0 per 5 seconds (per 5 sequences).
     3) Input only one integer between 1 and the max packets of the input file.
+    4) '--top N' lists the N longest outages, '--range X-Y' the outages that lost packets from Seq X to Seq Y.
 
 5. Counts of Lost-Packets during a Time-Period (-c)
     1) Input one or more integer values that seperate the numbers by ','
     2) The minimum value for the duration of time should be at least 1.
     3) The maximum value for the duration of time would be the max packets of the input file.
     4) e.g. With '-c 10,20', it'd list the total counts of each time period.
+    5) With '-s', the time periods slide forward one packet at a time.
 
 6. Convert one or more input file to a CSV and a Graph
     1) Default CSV filename: rtt.csv
     2) Default Graph file: rtt.html
     3) With '-g [name]' option, the default CSV and Graph would be replaced by [name].csv and [name].html.
+    4) In the graph, files with more than '--max-points' packets are downsampled (LTTB) with a min/max band.
+    5) With '--no-graph', skip the CSV and the graph (plotly is then not loaded).
 
 7. Output the result to a CSV file
     1) "Counts of Lost-Packets during a Time-Period", it would only show:
@@ -43,56 +48,312 @@ Features:
     2) Default output filename: output.csv
     3) With '-o [filename]' option, the default output will be replaced by filename.
 
+8. Cache parsed input files (--cache)
+    1) With '--cache [directory]', parsed packets are saved as .npy files and memory-mapped on the next run.
+    2) '--cache-size [MB]' bounds the cache; the least recently used files are removed first.
+
+9. Merge results across files and days (-a, --save-sketch, --load-sketch)
+    1) With '-a', add an 'ALL' result merged across the files; its percentiles come from a quantile sketch (within 1%).
+    2) '--save-sketch' saves the per-file sketches, '--load-sketch' merges saved sketches into '-a'.
+
+10. Follow a live ping output (-f)
+    1) Follow a single growing file, or '-' for STDIN, and print rolling statistics every '--interval' seconds.
+    2) The rolling window covers the most recent '--window' packets.
+    3) With '-t', alert on consecutive lost packets as they happen.
+
+11. Profile each stage (--profile)
+    1) Print wall time, CPU time, peak memory and rows/bytes of each stage to STDERR.
+    2) With '--profile-json [filename]', also save them as JSON.
+
+12. Analyze files in parallel (-j)
+    1) With '-j N', up to N files are analyzed at the same time in worker processes.
+    2) The results are written in the order of the input files.
+
+13. Keep a time-bucketed history (--rollup)
+    1) With '--rollup [db]', each file is added to per-minute and per-hour buckets in a SQLite file.
+    2) Query loss and RTT percentiles over any time range with rollup.py.
+
+14. Use from Python (PingCapture)
+    1) PingCapture.fromFile(filename) gives the same statistics as the report, computed on first use and kept.
+
+15. Collect from many targets (collector.py)
+    1) Probe many targets concurrently with ping or TCP connects and report each of them as for files.
+
+16. Name the owner of the target (--ip-index)
+    1) With '--ip-index [db]', the IP the replies came from is looked up in the IP index of elb_lookup.py.
+    2) The ELB and Route53 record names that own it are added to the report and to the output file.
+
 Notice:
 1. Exclude the timed-out packets that occur before the 1st successful ping packet. 
     (As in test02.txt, ignore timeouts before line 7.)
 2. Exclude the timed-out packets that occur after the last successful ping packet. 
     (As in test02.txt, ignore timeouts before line 46.)
+3. icmp_seq is unwrapped when it wraps from 65535 to 0, so sequence numbers keep counting past 65535.
 '''
+import io
+import os
 import re
+import bz2
+import array
+import gzip
+import lzma
+import sys
+import math
+import time
 import numpy
+import profiler
 import argparse
-import statistics
-import pandas as pd
-import plotly.offline as pyo
-import plotly.graph_objects as go
+import itertools
+import collections
+import contextlib
+# plotly, sketch, cache, rollup and concurrent.futures are imported by the features
+# that need them, to keep the start-up of a plain report short
 
 
 def go_parser():
     parser = argparse.ArgumentParser(description = 'Ping Statistics')
-    parser.add_argument('filenames',
+    parser.add_argument('filenames', nargs = '?', default = '',
                         help = 'Input the name of the file(s) that contain(s) the ping output, separated by \',\' if more than one file.')
     parser.add_argument('-t', '--timeout', action = 'store', dest = 'timeout',
                         help = 'Input a single integer between 1 and the maximum number of packets in the input file for the maximum consecutive timeout.')    
+    parser.add_argument('--top', action = 'store', dest = 'top', type = int,
+                        help = 'Input the number of longest outages to list')
+    parser.add_argument('--range', action = 'store', dest = 'range',
+                        help = 'Input a seq range as \'first-last\' to list the outages that lost packets in it')
     parser.add_argument('-p', '--percentiles', action = 'store', dest = 'percentiles',
                         help = 'Input value(s) (0-100), sepearted by \',\' if there is more than one value.')
     parser.add_argument('-c', '--count', action = 'store', dest = 'count',
                         help = 'Input number(s) for the duration of time period, sepearted by \',\' if more than one number')
+    parser.add_argument('-s', '--sliding', action = 'store_true',
+                        help = 'Count lost packets over sliding time periods that advance one packet at a time for -c')
     parser.add_argument('-g', '--graph', action = 'store', dest = 'graph',
                         help = 'Input a name for the csv and the graph files (default is \'rtt\' for rtt.csv and rtt.html')        
+    parser.add_argument('--no-graph', action = 'store_true', dest = 'no_graph',
+                        help = 'Skip the csv and the graph files, e.g. for a quick report')
+    parser.add_argument('--max-points', action = 'store', dest = 'max_points', type = int, default = 5000,
+                        help = 'Input the maximum number of points per file in the graph; longer series are downsampled (default is 5000, 0 for no limit)')
     parser.add_argument('-o', '--output', action = 'store', dest = 'output',
                         help = 'Input the output filename (default is output.csv)')
+    parser.add_argument('--cache', action = 'store', dest = 'cache_dir',
+                        help = 'Input a directory to cache the parsed input files in, so repeated runs skip parsing')
+    parser.add_argument('--cache-size', action = 'store', dest = 'cache_size', type = int, default = 1024,
+                        help = 'Input the maximum size of the cache in MB (default is 1024)')
+    parser.add_argument('-a', '--aggregate', action = 'store_true',
+                        help = 'Add an \'ALL\' result merged across the files and the loaded sketches, with percentiles from a quantile sketch')
+    parser.add_argument('--save-sketch', action = 'store', dest = 'save_sketch',
+                        help = 'Input a filename to save the per-file RTT sketches to, for merging with -a later')
+    parser.add_argument('--load-sketch', action = 'store', dest = 'load_sketch',
+                        help = 'Input the name of the sketch file(s) to merge into -a, separated by \',\' if more than one file')
+    parser.add_argument('-f', '--follow', action = 'store_true',
+                        help = 'Follow a single growing file (or \'-\' for stdin) and print rolling statistics')
+    parser.add_argument('--interval', action = 'store', dest = 'interval', type = float, default = 1.0,
+                        help = 'Input the refresh interval in seconds for -f (default is 1)')
+    parser.add_argument('--window', action = 'store', dest = 'window', type = int, default = 60,
+                        help = 'Input the number of most recent packets for the rolling window of -f (default is 60)')
+    parser.add_argument('--profile', action = 'store_true',
+                        help = 'Print the wall time, CPU time, peak memory and rows of each stage to stderr')
+    parser.add_argument('--profile-json', action = 'store', dest = 'profile_json',
+                        help = 'Input a filename to also save the --profile result to as JSON')
+    parser.add_argument('--rollup', action = 'store', dest = 'rollup',
+                        help = 'Input a SQLite file to add per-minute and per-hour history of the files to (query it with rollup.py)')
+    parser.add_argument('--target', action = 'store', dest = 'target',
+                        help = 'Input the target name for --rollup (default is the file name)')
+    parser.add_argument('--start-time', action = 'store', dest = 'start_time',
+                        help = 'Input the time of the first packet for --rollup, as epoch seconds or YYYY-MM-DD[THH:MM[:SS]] (default is the file time minus the duration)')
+    parser.add_argument('--ping-interval', action = 'store', dest = 'ping_interval', type = float, default = 1.0,
+                        help = 'Input the seconds between packets of the ping for --rollup (default is 1)')
+    parser.add_argument('--ip-index', action = 'store', dest = 'ip_index',
+                        help = 'Input the IP index file of elb_lookup.py to name the ELB and records of each target')
+    parser.add_argument('-j', '--jobs', action = 'store', dest = 'jobs', type = int, default = 1,
+                        help = 'Input the number of worker processes used to analyze the files (default is 1)')
 
     args = parser.parse_args()
     return args    
 
 '''
 Read in ping output from a file.
+The file is read in fixed-size chunks and each chunk is parsed in bulk, so
+memory use is bounded by the chunk size plus the compact result arrays.
+icmp_seq wraps from 65535 to 0 on long captures; it is unwrapped so that
+sequence numbers keep counting up past 65535.
+Returns (seq, rtt, lost):
+    seq  -- int64 array of icmp_seq for each reply, in file order
+    rtt  -- float64 array of round-trip times (ms) matching seq
+    lost -- int64 array of icmp_seq reported by "Request timeout" lines
 '''
-def read_ping_frm_file(filename: str) -> dict:
-    pattern = r'icmp_seq=([0-9]+).*time=([0-9]+\.[0-9]+)'
-    icmp = {}
-    
+CHUNK_SIZE = 4 * 1024 * 1024
+SEQ_MODULO = 65536
+REPLY_PATTERN = re.compile(rb'icmp_seq=([0-9]+).*time=([0-9]+\.[0-9]+)')
+TIMEOUT_PATTERN = re.compile(rb'Request timeout for icmp_seq ([0-9]+)')
+PING_PATTERN = re.compile(REPLY_PATTERN.pattern + b'|' + TIMEOUT_PATTERN.pattern)
+# 'PING host (address)' or '64 bytes from [host (]address[)]:'
+ADDRESS_PATTERN = re.compile(rb'^PING [^\s(]+ \(([0-9A-Fa-f.:]+)\)|bytes from (?:[^\s(]+ \()?([0-9A-Fa-f.:]*[0-9A-Fa-f])\)?:', re.M)
+ADDRESS_SAMPLE_SIZE = 64 * 1024
+
+def read_ping_frm_file(filename: str) -> tuple:
+    seq_chunks, reply_chunks, rtt_chunks = [], [], []
     try:
-        with open(filename) as f:
-            for line in f.readlines():
-                match = re.search(pattern, line.rstrip())
-                if match:
-                    seq, t = match.groups()
-                    icmp[int(seq)] = float(t)
-    except FileNotFoundError as e:
+        with openCapture(filename) as f:
+            tail = b''
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                # only parse complete lines; carry the partial one over
+                buf = tail + chunk
+                end = buf.rfind(b'\n') + 1
+                buf, tail = buf[:end], buf[end:]
+                parseChunk(buf, seq_chunks, reply_chunks, rtt_chunks)
+            parseChunk(tail, seq_chunks, reply_chunks, rtt_chunks)
+    except (OSError, EOFError, ImportError, lzma.LZMAError) as e:
+        print(e)
+
+    if not seq_chunks:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.float64), numpy.empty(0, dtype=numpy.int64)
+    seq = unwrapSeq(numpy.concatenate(seq_chunks))
+    is_reply = numpy.concatenate(reply_chunks)
+    rtt = numpy.concatenate(rtt_chunks)
+    lost = seq[~is_reply]
+    seq, rtt = dedupReplies(seq[is_reply], rtt)
+    return seq, rtt, lost
+
+
+'''
+Open a ping output file for reading, or STDIN for '-'.
+gzip, bz2, xz and zstd input is recognized by its magic bytes, whatever
+the file name, and decompressed on the fly as it is read.
+'''
+def openZstd(source, mode: str):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading zstd input needs the `zstandard` package: pip3 install zstandard')
+    return zstandard.open(source, mode)
+
+COMPRESSED_FORMATS = [
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+    (b'\x28\xb5\x2f\xfd', openZstd),
+]
+
+def openCapture(filename: str):
+    if filename == '-':
+        source = sys.stdin.buffer
+        magic = source.peek(6)[:6]
+    else:
+        source = filename
+        with open(filename, 'rb') as f:
+            magic = f.read(6)
+    for prefix, opener in COMPRESSED_FORMATS:
+        if magic.startswith(prefix):
+            return opener(source, 'rb')
+    return source if filename == '-' else open(filename, 'rb')
+
+
+'''
+Extract icmp_seq/time of replies and icmp_seq of timeouts, in file order,
+from a block of complete lines.
+Each captured column is joined into one string and converted by NumPy in a
+single call, rather than building a 2-D array of the matched tuples.
+'''
+def parseChunk(buf: bytes, seq_chunks: list, reply_chunks: list, rtt_chunks: list):
+    if not buf:
+        return
+    matches = PING_PATTERN.findall(buf)
+    if not matches:
+        return
+    # a match has either the seq of a reply or the seq of a timeout; the other is b''
+    seq_text = b' '.join([reply_seq + lost_seq for reply_seq, _, lost_seq in matches])
+    rtt_column = [rtt for _, rtt, _ in matches]
+    is_reply = numpy.fromiter(map(len, rtt_column), dtype=numpy.int64, count=len(rtt_column)) > 0
+    seq_chunks.append(numpy.fromstring(seq_text, dtype=numpy.int64, sep=' '))
+    reply_chunks.append(is_reply)
+    # the empty rtt of timeouts only adds separators, which are skipped
+    rtt_chunks.append(numpy.fromstring(b' '.join(rtt_column), dtype=numpy.float64, sep=' ')
+                      if is_reply.any() else numpy.empty(0, dtype=numpy.float64))
+
+
+'''
+Undo the 16-bit wraparound of icmp_seq (65535 -> 0), given in file order.
+A drop of more than half the range is a wrap; a jump up of more than half
+the range is a late packet from before the last wrap.
+'''
+def unwrapSeq(seq) -> numpy.ndarray:
+    seq = numpy.asarray(seq, dtype=numpy.int64)
+    if seq.size < 2 or seq.max() >= SEQ_MODULO:
+        return seq
+    steps = numpy.diff(seq)
+    wraps = (steps < -SEQ_MODULO // 2).astype(numpy.int64) - (steps > SEQ_MODULO // 2)
+    if not wraps.any():
+        return seq
+    offsets = numpy.concatenate(([0], numpy.cumsum(wraps))) * SEQ_MODULO
+    return seq + offsets
+
+
+'''
+Drop duplicate replies (e.g. DUP!), keeping the first position of each
+icmp_seq and the RTT of its last reply
+'''
+def dedupReplies(seq, rtt) -> tuple:
+    _, first = numpy.unique(seq, return_index=True)
+    if first.size == seq.size:
+        return seq, rtt
+    _, last_rev = numpy.unique(seq[::-1], return_index=True)
+    last = seq.size - 1 - last_rev
+    order = numpy.argsort(first)
+    return seq[first[order]], rtt[last[order]]
+
+
+'''
+Read the IP address a capture pinged from its header or first reply,
+or '' if it has none (e.g. STDIN, which cannot be read twice)
+'''
+def readAddress(filename: str) -> str:
+    if filename == '-':
+        return ''
+    try:
+        with openCapture(filename) as f:
+            match = ADDRESS_PATTERN.search(f.read(ADDRESS_SAMPLE_SIZE))
+    except (OSError, EOFError, ImportError, lzma.LZMAError) as e:
         print(e)
-    return icmp    
+        return ''
+    return (match.group(1) or match.group(2)).decode() if match else ''
+
+
+'''
+Look up the owners of an IP in the IP index written by elb_lookup.py. (--ip-index)
+The index is opened read-only once per process; the IP is its primary key,
+so each lookup is a single B-tree search.
+Returns (ELB, record names, last seen) tuples, most recently seen first.
+'''
+IP_INDEX_CONNECTIONS = {}
+
+def lookupAddress(ip_index: str, address: str) -> list:
+    import json
+    import sqlite3
+    import urllib.request
+    conn = IP_INDEX_CONNECTIONS.get(ip_index)
+    if conn is None:
+        uri = 'file:{}?mode=ro'.format(urllib.request.pathname2url(os.path.abspath(ip_index)))
+        conn = IP_INDEX_CONNECTIONS[ip_index] = sqlite3.connect(uri, uri=True)
+    rows = conn.execute('SELECT elb, names, last_seen FROM ip_index WHERE ip = ? ORDER BY last_seen DESC', (address,))
+    return [(elb, json.loads(names), last_seen) for elb, names, last_seen in rows]
+
+
+'''
+Read in ping output from a file through the parsed-capture cache (--cache)
+'''
+def readCapture(filename: str, cache_dir: str = None, cache_size: int = 1024) -> tuple:
+    if not cache_dir:
+        return read_ping_frm_file(filename)
+    import cache
+    key = cache.get_key(filename)
+    arrays = cache.load(cache_dir, key)
+    if arrays is None:
+        arrays = read_ping_frm_file(filename)
+        cache.save(cache_dir, key, arrays, cache_size * 1024 * 1024)
+    return arrays
 
 
 '''
@@ -109,55 +370,101 @@ def output_to_file(lines:str, filename: str) -> bool:
 
 '''
 Covert the ping output of all input files to a CSV file. (-g)
+Rows are formatted and written in batches, so the whole CSV is never held
+in memory.
 '''
-def convert_to_CSV(rtt: dict, filename: str) -> str:
+CSV_BATCH_SIZE = 100000
+
+def convert_to_CSV(rtt: dict, filename: str) -> bool:
     if not rtt:
         print('Invalid Round-Trip Time for CSV file!')
         exit()
 
-    lines = 'File,Packet,RTT(ms)\n'
-    for file, values in rtt.items():
-        for i in range(0, len(values)):
-            lines += '{},{},{}\n'.format(file,i + 1, values[i])
     try:
-        with open(filename + '.csv', 'w') as f:
-            f.write(lines)
+        with open(filename + '.csv', 'w', buffering=1024 * 1024) as f:
+            f.write('File,Packet,RTT(ms)\n')
+            for file, values in rtt.items():
+                for start in range(0, len(values), CSV_BATCH_SIZE):
+                    batch = values[start:start + CSV_BATCH_SIZE].tolist()
+                    f.write(''.join(['{},{},{}\n'.format(file, i, value) for i, value in enumerate(batch, start + 1)]))
     except FileNotFoundError as e:
         print(e)
-    return lines 
+        return False
+    return True
+
+
+'''
+Pick the indices of up to `threshold` points that preserve the shape of a
+series, using Largest-Triangle-Three-Buckets: keep the first and last
+points, and from each bucket in between the point forming the largest
+triangle with the previously kept point and the average of the next bucket.
+'''
+def downsampleLTTB(x, y, threshold: int) -> numpy.ndarray:
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return numpy.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    sampled = numpy.empty(threshold, dtype=numpy.int64)
+    sampled[0] = a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        area = numpy.abs((x[a] - avg_x) * (y[range_start:range_end] - y[a])
+                         - (x[a] - x[range_start:range_end]) * (avg_y - y[a]))
+        a = range_start + int(area.argmax())
+        sampled[i + 1] = a
+    sampled[-1] = n - 1
+    return sampled
 
 
 '''
-Generate a graph from converted ping output from a CSV file. (-g)
+Min/max of a series over `buckets` equal buckets, as (x, min, max)
 '''
-def getGraph(rtt: dict, filename: str) -> bool:
+def getEnvelope(x, y, buckets: int) -> tuple:
+    starts = numpy.linspace(0, len(y), buckets, endpoint=False).astype(numpy.int64)
+    return x[starts], numpy.minimum.reduceat(y, starts), numpy.maximum.reduceat(y, starts)
+
+
+'''
+Generate a graph from the ping output of all input files. (-g)
+Series longer than max_points are downsampled with LTTB and drawn with a
+min/max envelope, which keeps the HTML small for long captures.
+'''
+def getGraph(rtt: dict, filename: str, max_points: int = 5000, auto_open: bool = True) -> bool:
     if not rtt:
         print('Invalid Round-Trip Time for graph!')
         exit()
+    import plotly.offline as pyo
+    import plotly.graph_objects as go
 
     #  In order to make sure x-axis has enough values, 
     # sorted files by packet numbers in descending order 
-    files = {}
-    for file, rtt_list in rtt.items():
-        files[file] = len(rtt_list)
-    files = [file for file, v in list(sorted(files.items(), key=lambda item: item[1], reverse=True))]
-
-    try:
-        df = pd.read_csv(filename + '.csv')
-    except FileNotFoundError as e:
-        print(e)
-        return False  
+    files = sorted(rtt, key=lambda file: len(rtt[file]), reverse=True)
 
     data = []
     for file in files:
-        trace = go.Scatter(x=df[df['File']==file]['Packet'],
-                           y=df[df['File']==file]['RTT(ms)'],
-                           mode='lines+markers',
-                           name=file)
-        data.append(trace)
+        y = numpy.asarray(rtt[file], dtype=numpy.float64)
+        x = numpy.arange(1, len(y) + 1)
+        if not max_points or len(y) <= max_points:
+            data.append(go.Scatter(x=x, y=y, mode='lines+markers', name=file))
+            continue
+
+        env_x, env_min, env_max = getEnvelope(x, y, max_points)
+        data.append(go.Scatter(x=env_x, y=env_max, mode='lines', line=dict(width=0),
+                               legendgroup=file, showlegend=False, hoverinfo='skip', name=file + ' max'))
+        data.append(go.Scatter(x=env_x, y=env_min, mode='lines', line=dict(width=0), fill='tonexty',
+                               legendgroup=file, showlegend=False, hoverinfo='skip', name=file + ' min'))
+        sampled = downsampleLTTB(x, y, max_points)
+        data.append(go.Scatter(x=x[sampled], y=y[sampled], mode='lines', legendgroup=file, name=file))
     layout = go.Layout(title = 'Ping Statistics')
     fig = go.Figure(data=data,layout=layout)
-    pyo.plot(fig, filename=filename + '.html')
+    pyo.plot(fig, filename=filename + '.html', auto_open=auto_open)
     return True
 
 
@@ -171,34 +478,77 @@ def getPercentage(num1: int, num2: int) -> float:
 '''
 Counts lost packets
 '''
-def countMissingPackets(seq_list: list) -> int:
-    count = 0
-    for i in range(min(seq_list), max(seq_list) + 1):
-        if i not in seq_list:
-            count += 1
-    return count
+def countMissingPackets(seq_list) -> int:
+    seq_list = numpy.unique(seq_list)
+    return int(seq_list[-1] - seq_list[0] + 1 - seq_list.size)
 
 
 '''
 Retrieve the sequence number before and after the requested consecutive timeout period (-t)
 '''
-def getTimeout(timeout_packets:int, seq_list: list) -> list:
+def getTimeout(timeout_packets:int, seq_list) -> list:
     if int(timeout_packets) < 1:
         exit()
-    timeout_list = []
-    for i in range(len(sorted(seq_list))):
-        if seq_list[i] == seq_list[-1]:
-            break
-        elif (seq_list[i + 1] - seq_list[i]) > int(timeout_packets):
-            timeout_list.append((seq_list[i], seq_list[i + 1]))
-    return timeout_list
+    return OutageIndex(seq_list).getTimeouts(int(timeout_packets))
+
+
+'''
+Index of the outages (runs of lost packets) of a capture, built once from
+its icmp_seq array. Each outage is kept as the last seq received before it
+and the first seq received after it. Outages by minimum length (-t), the
+longest ones (--top) and the ones overlapping a seq range (--range) are
+answered from sorted arrays without rescanning the packets.
+'''
+class OutageIndex:
+    __slots__ = ('starts', 'ends', 'lost', 'by_length')
+
+    def __init__(self, seq_list):
+        seq_list = numpy.unique(numpy.asarray(seq_list, dtype=numpy.int64))
+        gaps = numpy.flatnonzero(numpy.diff(seq_list) > 1)
+        self.starts = seq_list[gaps]
+        self.ends = seq_list[gaps + 1]
+        self.lost = self.ends - self.starts - 1
+        # longest first; stable, so outages of equal length stay in seq order
+        self.by_length = numpy.argsort(-self.lost, kind='stable')
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def getOutages(self, index) -> list:
+        return list(zip(self.starts[index].tolist(), self.ends[index].tolist()))
+
+    # outages of at least timeout_packets lost packets, in seq order
+    def getTimeouts(self, timeout_packets: int) -> list:
+        count = numpy.searchsorted(-self.lost[self.by_length], -timeout_packets, side='right')
+        return self.getOutages(numpy.sort(self.by_length[:count]))
+
+    # the k longest outages, longest first
+    def getLongest(self, k: int) -> list:
+        return self.getOutages(self.by_length[:k])
+
+    # outages losing any packet from first_seq to last_seq, in seq order
+    def getOverlapping(self, first_seq: int, last_seq: int) -> list:
+        lo = numpy.searchsorted(self.ends, first_seq + 1, side='left')
+        hi = numpy.searchsorted(self.starts, last_seq - 1, side='right')
+        return self.getOutages(slice(lo, max(lo, hi)))
+
+
+'''
+Print a list of outages and return it as a CSV cell
+'''
+def printOutages(outage_list: list, no_match: str) -> str:
+    if not outage_list:
+        print(no_match)
+        return 'No Match!,'
+    print(''.join([' Seq {} to {} : {:5d} packets lost\n'.format(p1, p2, p2 - p1 - 1) for p1, p2 in outage_list]))
+    return '"' + ''.join(['Seq {} to {} : {:d} packets lost\n'.format(p1, p2, p2 - p1 - 1) for p1, p2 in outage_list]) + '",'
 
 
 '''
 Calculate Percentile(s) (-p)
 '''
-def getPercentiles(seq_list: list, nums: list) -> dict:
-    if not seq_list or not nums:
+def getPercentiles(seq_list, nums: list) -> dict:
+    if len(seq_list) == 0 or not nums:
         print('Invalid Percentile!')
         exit()
     values = {}
@@ -210,61 +560,686 @@ def getPercentiles(seq_list: list, nums: list) -> dict:
     return values
 
 
+'''
+Build prefix sums over the received-packet bitmap, so that the number of
+lost packets in any seq range is a difference of two entries
+'''
+def getLossPrefix(seq_list) -> numpy.ndarray:
+    seq_list = numpy.asarray(seq_list, dtype=numpy.int64)
+    first_seq = seq_list.min()
+    received = numpy.zeros(seq_list.max() - first_seq + 1, dtype=bool)
+    received[seq_list - first_seq] = True
+    lost_prefix = numpy.zeros(received.size + 1, dtype=numpy.int64)
+    numpy.cumsum(~received, out=lost_prefix[1:])
+    return lost_prefix
+
+
 '''
 Display the number of lost packets during the requested time period. (-c)
+Every time period is answered from the same prefix sums, which can be
+passed in as lost_prefix when they are already built. Each value is an
+array of [first seq, last seq, lost packets] rows; with sliding=True the
+periods advance one packet at a time instead of one period at a time.
 '''
-def getPacketsPerTimePeriod(time_period: list, seq_list:list) -> dict:
-    if not time_period or not seq_list:
+def getPacketsPerTimePeriod(time_period: list, seq_list, sliding: bool = False, lost_prefix=None) -> dict:
+    if not time_period or len(seq_list) == 0:
         print('Invalid Time Period Value!')
         exit()
-    periods = {}
+    first_seq = int(numpy.min(seq_list))
+    span = int(numpy.max(seq_list)) - first_seq
     for time in time_period:
-        if type(time) != int or int(time) < 1 or (time >= max(seq_list) - min(seq_list)):
+        if type(time) != int or int(time) < 1 or time >= span:
             print('Invalid Integer Value!')
             return {}
-            
-        for i in range(0, max(seq_list) - min(seq_list) + 1, time):
-            # time period should not be over the last icmp_seq #
-            if min(seq_list) + i + time - 1 > max(seq_list):
-                last_seq = max(seq_list)
+
+    if lost_prefix is None:
+        lost_prefix = getLossPrefix(seq_list)
+    periods = {}
+    for time in time_period:
+        if sliding:
+            starts = numpy.arange(0, span - time + 2)
+        else:
+            starts = numpy.arange(0, span + 1, time)
+        # time period should not be over the last icmp_seq #
+        ends = numpy.minimum(starts + time - 1, span)
+        lost = lost_prefix[ends + 1] - lost_prefix[starts]
+        periods[time] = numpy.column_stack((starts + first_seq, ends + first_seq, lost))
+    return periods
+
+
+'''
+A parsed ping capture, for analysis in-process without the CLI:
+    capture = PingCapture.fromFile('ping.txt')
+    capture.loss_rate, capture.rtt_avg, capture.getPercentiles([50, 99])
+The packets are kept as NumPy arrays. Counts, RTT moments, the outage index,
+the loss prefix sums and each percentile are computed on first use and kept,
+so asking for the same statistic again costs nothing.
+'''
+class PingCapture:
+    __slots__ = ('name', 'address', 'seq', 'rtt', 'lost_seq',
+                 '_sorted_seq', '_lost', '_moments', '_outages', '_lost_prefix', '_percentiles')
+
+    def __init__(self, seq, rtt, lost_seq=(), name: str = '', address: str = ''):
+        self.name = name
+        # the IP the replies came from, if known; see readAddress
+        self.address = address
+        self.seq = numpy.asarray(seq, dtype=numpy.int64)
+        self.rtt = numpy.asarray(rtt, dtype=numpy.float64)
+        self.lost_seq = numpy.asarray(lost_seq, dtype=numpy.int64)
+        self._sorted_seq = None
+        self._lost = None
+        self._moments = None
+        self._outages = None
+        self._lost_prefix = None
+        self._percentiles = {}
+
+    @classmethod
+    def fromFile(cls, filename: str, cache_dir: str = None, cache_size: int = 1024) -> 'PingCapture':
+        seq, rtt, lost_seq = readCapture(filename, cache_dir, cache_size)
+        return cls(seq, rtt, lost_seq, filename)
+
+    def __len__(self) -> int:
+        return self.seq.size
+
+    @property
+    def sorted_seq(self) -> numpy.ndarray:
+        if self._sorted_seq is None:
+            self._sorted_seq = numpy.sort(self.seq)
+        return self._sorted_seq
+
+    # None for an empty capture
+    @property
+    def first_seq(self) -> int:
+        return int(self.sorted_seq[0]) if self.seq.size else None
+
+    @property
+    def last_seq(self) -> int:
+        return int(self.sorted_seq[-1]) if self.seq.size else None
+
+    # Packet Count
+    @property
+    def transmitted(self) -> int:
+        return self.last_seq - self.first_seq + 1 if self.seq.size else 0
+
+    @property
+    def lost(self) -> int:
+        if self._lost is None:
+            self._lost = countMissingPackets(self.sorted_seq) if self.seq.size else 0
+        return self._lost
+
+    @property
+    def received(self) -> int:
+        return self.transmitted - self.lost
+
+    @property
+    def loss_rate(self) -> float:
+        return getPercentage(self.lost, self.transmitted) if self.transmitted else 0.0
+
+    # RTT as (min, max, avg, stddev); all None for an empty capture,
+    # and a stddev of 0.0 for a single reply
+    @property
+    def moments(self) -> tuple:
+        if self._moments is None:
+            if not self.rtt.size:
+                self._moments = (None, None, None, None)
             else:
-                last_seq = min(seq_list) + i + time - 1
-            
-            # packet count
-            packet_count = 0
-            for j in range(time):
-                if min(seq_list) + i + j > max(seq_list):
-                    break
-                if min(seq_list) + i + j not in seq_list:
-                    packet_count += 1
+                stddev = float(self.rtt.std(ddof=1)) if self.rtt.size > 1 else 0.0
+                self._moments = (float(self.rtt.min()), float(self.rtt.max()),
+                                 float(self.rtt.sum() / self.received), stddev)
+        return self._moments
+
+    @property
+    def rtt_min(self) -> float:
+        return self.moments[0]
+
+    @property
+    def rtt_max(self) -> float:
+        return self.moments[1]
+
+    @property
+    def rtt_avg(self) -> float:
+        return self.moments[2]
+
+    @property
+    def rtt_stddev(self) -> float:
+        return self.moments[3]
 
-            if time not in periods:
-                periods[time] = [[min(seq_list) + i, last_seq, packet_count]]
+    # Percentiles (-p), computed only for the ones not asked for before
+    def getPercentiles(self, nums: list) -> dict:
+        if not self.rtt.size:
+            return {}
+        missing = [num for num in nums if num not in self._percentiles]
+        if missing:
+            self._percentiles.update(getPercentiles(self.rtt, missing))
+        return {num: self._percentiles[num] for num in nums if num in self._percentiles}
+
+    # Outages (-t, --top, --range)
+    @property
+    def outages(self) -> OutageIndex:
+        if self._outages is None:
+            self._outages = OutageIndex(self.sorted_seq)
+        return self._outages
+
+    def getTimeouts(self, timeout_packets: int) -> list:
+        return self.outages.getTimeouts(timeout_packets)
+
+    def getLongest(self, k: int) -> list:
+        return self.outages.getLongest(k)
+
+    def getOverlapping(self, first_seq: int, last_seq: int) -> list:
+        return self.outages.getOverlapping(first_seq, last_seq)
+
+    # Lost packets per time period (-c)
+    def getPacketsPerTimePeriod(self, time_period: list, sliding: bool = False) -> dict:
+        if self._lost_prefix is None and self.seq.size:
+            self._lost_prefix = getLossPrefix(self.sorted_seq)
+        return getPacketsPerTimePeriod(time_period, self.sorted_seq, sliding, self._lost_prefix)
+
+    # RTT sketch for merging across captures (-a)
+    def getSketch(self):
+        import sketch
+        rtt_sketch = sketch.DDSketch()
+        rtt_sketch.add(self.rtt)
+        return rtt_sketch
+
+
+
+'''
+Rolling statistics for a live ping stream. (-f)
+Totals since the start use Welford's online mean/variance. The window keeps
+the most recent packets in a ring buffer, with monotonic deques for its
+min/max, so each packet costs constant time and memory.
+'''
+class RollingStats:
+    def __init__(self, window: int):
+        self.window = window
+        self.sent = self.lost = 0
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+        self.rtt_min = self.rtt_max = None
+        self.resetWindow()
+
+    def resetWindow(self):
+        self.ring = collections.deque()
+        self.ring_lost = 0
+        self.win_count, self.win_mean, self.win_m2 = 0, 0.0, 0.0
+        # (packet index, rtt) pairs, increasing / decreasing by rtt
+        self.win_min = collections.deque()
+        self.win_max = collections.deque()
+
+    def addPacket(self, rtt):
+        index = self.sent
+        self.sent += 1
+        if rtt is None:
+            self.lost += 1
+            self.ring_lost += 1
+        else:
+            self.count += 1
+            delta = rtt - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (rtt - self.mean)
+            self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+            self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+
+            self.win_count += 1
+            delta = rtt - self.win_mean
+            self.win_mean += delta / self.win_count
+            self.win_m2 += delta * (rtt - self.win_mean)
+            while self.win_min and self.win_min[-1][1] >= rtt:
+                self.win_min.pop()
+            self.win_min.append((index, rtt))
+            while self.win_max and self.win_max[-1][1] <= rtt:
+                self.win_max.pop()
+            self.win_max.append((index, rtt))
+
+        self.ring.append(rtt)
+        if len(self.ring) > self.window:
+            self.dropOldest(index - self.window)
+
+    def addLate(self, age: int, rtt: float):
+        # a reply for a packet already counted as lost, `age` packets ago;
+        # only packets still in the window can be told apart from duplicates
+        if age >= len(self.ring) or self.ring[-1 - age] is not None:
+            return
+        self.ring[-1 - age] = rtt
+        self.lost -= 1
+        self.ring_lost -= 1
+        self.count += 1
+        delta = rtt - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (rtt - self.mean)
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+        self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+        self.win_count += 1
+        delta = rtt - self.win_mean
+        self.win_mean += delta / self.win_count
+        self.win_m2 += delta * (rtt - self.win_mean)
+        self.win_min.clear()
+        self.win_max.clear()
+        first_index = self.sent - len(self.ring)
+        for index, value in enumerate(self.ring, first_index):
+            if value is None:
+                continue
+            while self.win_min and self.win_min[-1][1] >= value:
+                self.win_min.pop()
+            self.win_min.append((index, value))
+            while self.win_max and self.win_max[-1][1] <= value:
+                self.win_max.pop()
+            self.win_max.append((index, value))
+
+    def dropOldest(self, index: int):
+        rtt = self.ring.popleft()
+        if rtt is None:
+            self.ring_lost -= 1
+        elif self.win_count == 1:
+            self.win_count, self.win_mean, self.win_m2 = 0, 0.0, 0.0
+        else:
+            mean = self.win_mean
+            self.win_count -= 1
+            self.win_mean -= (rtt - mean) / self.win_count
+            self.win_m2 = max(self.win_m2 - (rtt - mean) * (rtt - self.win_mean), 0.0)
+        if self.win_min and self.win_min[0][0] <= index:
+            self.win_min.popleft()
+        if self.win_max and self.win_max[0][0] <= index:
+            self.win_max.popleft()
+
+    def addLost(self, count: int):
+        if count < self.window:
+            for _ in range(count):
+                self.addPacket(None)
+            return
+        # the whole window is lost packets
+        self.sent += count
+        self.lost += count
+        self.resetWindow()
+        self.ring.extend([None] * self.window)
+        self.ring_lost = self.window
+
+    def getSummary(self) -> str:
+        summary = ' Sent {:d} Lost {:d} ({:.2f}%)'.format(
+            self.sent, self.lost, getPercentage(self.lost, self.sent) if self.sent else 0.0)
+        if self.count:
+            stddev = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+            summary += ' | RTT min/avg/max/stddev = {:.3f}/{:.3f}/{:.3f}/{:.3f} ms'.format(
+                self.rtt_min, self.mean, self.rtt_max, stddev)
+        summary += '\n Last {:d} packets: Lost {:d} ({:.2f}%)'.format(
+            len(self.ring), self.ring_lost, getPercentage(self.ring_lost, len(self.ring)) if self.ring else 0.0)
+        if self.win_count:
+            stddev = math.sqrt(self.win_m2 / (self.win_count - 1)) if self.win_count > 1 else 0.0
+            summary += ' | RTT min/avg/max/stddev = {:.3f}/{:.3f}/{:.3f}/{:.3f} ms'.format(
+                self.win_min[0][1], self.win_mean, self.win_max[0][1], stddev)
+        return summary
+
+
+'''
+Parse a live ping output one line at a time. (-f, collector.py)
+icmp_seq is unwrapped as it wraps, late replies are moved back into the
+rolling window and, with timeout_packets, runs of lost packets are alerted
+on. With keep=True the parsed packets are also kept, compactly, so the
+stream can be analyzed as a PingCapture when it ends.
+'''
+class PingStream:
+    def __init__(self, window: int, timeout_packets: int = 0, keep: bool = False):
+        self.stats = RollingStats(window)
+        self.timeout_packets = timeout_packets
+        self.next_seq = None
+        self.wrap_offset = 0
+        self.run_lost = 0
+        self.keep = keep
+        self.seq = array.array('q')
+        self.rtt = array.array('d')
+        self.lost_seq = array.array('q')
+        self.address = ''
+
+    # returns an alert to print, or ''
+    def addLine(self, line: bytes) -> str:
+        match = REPLY_PATTERN.search(line)
+        if match:
+            seq, rtt = int(match.group(1)), float(match.group(2))
+            if not self.address:
+                address = ADDRESS_PATTERN.search(line)
+                self.address = (address.group(1) or address.group(2)).decode() if address else ''
+        else:
+            match = TIMEOUT_PATTERN.search(line)
+            if not match:
+                return ''
+            seq, rtt = int(match.group(1)), None
+
+        seq += self.wrap_offset
+        if self.next_seq is not None and seq < self.next_seq - SEQ_MODULO // 2:
+            self.wrap_offset += SEQ_MODULO
+            seq += SEQ_MODULO
+        elif self.next_seq is not None and seq > self.next_seq + SEQ_MODULO // 2:
+            # late packet from before the last wrap
+            seq -= SEQ_MODULO
+        if self.keep:
+            if rtt is None:
+                self.lost_seq.append(seq)
             else:
-                periods[time].append([min(seq_list) + i, last_seq, packet_count])
-    return periods
+                self.seq.append(seq)
+                self.rtt.append(rtt)
 
+        if self.next_seq is None:
+            if rtt is None:
+                return ''
+            self.next_seq = seq
+        if seq < self.next_seq:
+            if rtt is not None:
+                self.stats.addLate(self.next_seq - 1 - seq, rtt)
+            return ''
 
+        alert = ''
+        if seq > self.next_seq:
+            self.stats.addLost(seq - self.next_seq)
+            self.run_lost += seq - self.next_seq
+        self.stats.addPacket(rtt)
+        self.next_seq = seq + 1
+        if rtt is None:
+            self.run_lost += 1
+            if self.timeout_packets and self.run_lost == self.timeout_packets:
+                alert = '[ Alert: {} consecutive packets lost since Seq {} ]'.format(self.run_lost, seq - self.run_lost)
+        else:
+            if self.timeout_packets and self.run_lost >= self.timeout_packets:
+                alert = ' Seq {} to {} : {:5d} packets lost'.format(seq - self.run_lost - 1, seq, self.run_lost)
+            self.run_lost = 0
+        return alert
 
-def main():
-    args = go_parser()
-    output_filename = 'output.csv'
-    rtt_filename = 'rtt'
-    rtt = {}
-    lines = ''
-    title = ''
+    def getLastSeq(self) -> str:
+        return str(self.next_seq - 1) if self.next_seq else '-'
 
-    for filename in args.filenames.split(','):
+    # the packets kept so far (keep=True), with duplicate replies dropped
+    def getCapture(self, name: str = '') -> 'PingCapture':
+        seq, rtt = dedupReplies(numpy.array(self.seq, dtype=numpy.int64), numpy.array(self.rtt, dtype=numpy.float64))
+        return PingCapture(seq, rtt, numpy.array(self.lost_seq, dtype=numpy.int64), name, self.address)
+
+
+'''
+Follow a growing ping output file or stdin and print rolling statistics. (-f)
+Timeouts before the first successful packet are excluded, as for files.
+With timeout_packets, alert once a run of consecutive lost packets reaches
+it and report the run when packets are received again.
+'''
+def followCapture(filename: str, timeout_packets: int, interval: float, window: int) -> RollingStats:
+    stream = PingStream(window, timeout_packets)
+    partial = b''
+    try:
+        f = sys.stdin.buffer if filename == '-' else open(filename, 'rb')
+    except OSError as e:
+        print(e)
+        return None
+    last_refresh = time.monotonic()
+    try:
+        while True:
+            line = f.readline()
+            if not line:
+                if filename == '-':
+                    break
+                time.sleep(min(interval, 0.2))
+            elif not line.endswith(b'\n') and filename != '-':
+                # ping is still writing this line
+                partial += line
+                continue
+            else:
+                line, partial = partial + line, b''
+                alert = stream.addLine(line)
+                if alert:
+                    print(alert, flush=True)
+
+            now = time.monotonic()
+            if now - last_refresh >= interval:
+                print(' Seq {} |'.format(stream.getLastSeq()) + stream.stats.getSummary(), flush=True)
+                last_refresh = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+    print('\n // Rolling Statistics //')
+    print(stream.stats.getSummary())
+    return stream.stats
+
+
+'''
+Analyze a single ping output file.
+The report that would be printed is captured, so files can be analyzed in
+worker processes and still be written out in the requested order.
+'''
+def analyzeFile(filename: str, args) -> tuple:
+    report = io.StringIO()
+    stages = profiler.StageProfiler(args.profile)
+    with contextlib.redirect_stdout(report):
         print('------------------\n {} \n------------------'.format(filename))        
-        icmp = read_ping_frm_file(filename)
-        title = 'File Name,Transmitted,Received,Packet Loss, Loss Rate,RTT Min,RTT Max,RTT Avg,RTT STDDEV,'
-        lines += filename + ','
-
-        # Packet Count
-        transmitted_packets = max(icmp.keys()) - min(icmp.keys()) + 1
-        loss_packets = countMissingPackets(icmp.keys())
-        received_packets = transmitted_packets - loss_packets
-        packet_loss_rate = getPercentage(loss_packets, transmitted_packets)
+        stages.begin('parse', filename)
+        capture = PingCapture.fromFile(filename, args.cache_dir, args.cache_size)
+        # the statistics are computed lazily; sort now so parsing is profiled as one stage
+        capture.sorted_seq
+        stages.end(len(capture) + len(capture.lost_seq), os.path.getsize(filename) if os.path.exists(filename) else None)
+        title, lines, file_sketch = analyzeCapture(capture, args, stages)
+
+    return report.getvalue(), title, lines, capture.rtt, file_sketch, stages.records
+
+
+'''
+Print the report of a parsed capture and return its CSV title, CSV line and
+RTT sketch (for -a and --save-sketch). Used for files and for the streams
+of collector.py.
+The title is '' for a capture without packets, which has none of the
+columns of the options, so the CSV header is taken from a capture with data.
+'''
+CSV_TITLE = 'File Name,Transmitted,Received,Packet Loss, Loss Rate,RTT Min,RTT Max,RTT Avg,RTT STDDEV,'
+
+def analyzeCapture(capture: PingCapture, args, stages: profiler.StageProfiler) -> tuple:
+    filename = capture.name
+    title = CSV_TITLE
+    lines = filename + ','
+    if not len(capture):
+        print('[ No ping output found in \'{}\' ]'.format(filename))
+        return '', lines + '\n', None
+
+    # Packet Count
+    stages.begin('counts', filename)
+    print('\n // Packet Counts //')
+    print(' Transmitted   {:6d} packets'.format(capture.transmitted))
+    print(' Received      {:6d} packets'.format(capture.received))
+    print(' Lost          {:6d} packets'.format(capture.lost))
+    print(' Packet Loss Rate is {:5.2f}%'.format(capture.loss_rate))
+    lines += str(capture.transmitted) + ' packets,' + str(capture.received) + ' packets,' \
+            + str(capture.lost) + ' packets,' + '{:.2f}%'.format(capture.loss_rate) + ','
+
+    stages.end(len(capture))
+
+    # RTT
+    stages.begin('rtt', filename)
+    print('\n // Round-Trip Time //')
+    rtt_min, rtt_max, rtt_avg, rtt_stddev = capture.moments
+    print(' Round-trip min    = {:9.3f} ms'.format(rtt_min))
+    print(' Round-trip max    = {:9.3f} ms'.format(rtt_max))
+    print(' Round-trip avg    = {:9.3f} ms'.format(rtt_avg))
+    print(' Round-trip stddev = {:9.3f} ms'.format(rtt_stddev))
+    lines += '{:.3f} ms,'.format(rtt_min) + '{:.3f} ms,'.format(rtt_max) \
+            + '{:.3f} ms,'.format(rtt_avg) + '{:.3f} ms,'.format(rtt_stddev)
+    stages.end(len(capture.rtt))
+           
+    # Percentile Calculation (-p)
+    if args.percentiles:
+        stages.begin('percentiles', filename)
+        print('\n // Percentiles //')
+        try:
+            percentiles_values = list(map(int, re.split(r'\D+', args.percentiles)))
+            percentiles = capture.getPercentiles(percentiles_values)
+            if not percentiles:
+                print('[ Error occured on calculating percentile! ]')
+            else:
+                print(''.join(['{:3d}th Percentile is {:9.3f} ms\n'.format(percentile, value) for percentile, value in percentiles.items()]))
+                title += ''.join(['{:3d}th Percentile,'.format(p) for p in percentiles.keys()])
+                lines +=  ''.join(['{:.3f} ms,'.format(percentiles[p]) for p in percentiles.keys()])                    
+        except ValueError as e:
+            print('[ Error on Percentiles: {} ]'.format(e))
+    stages.end(len(capture.rtt))
+
+    # Outages for -t, --top and --range
+    if args.timeout or args.top is not None or args.range:
+        stages.begin('outages', filename)
+        # built once for all three options
+        capture.outages
+
+    # Timeout Consecutively (-t)
+    if args.timeout:
+        print('\n // Consecutive Timeouts //')
+        if not args.timeout.isnumeric() or int(args.timeout) < 0 or int(args.timeout) >= capture.last_seq - capture.first_seq:
+            print('[ Error on Timeout Value: \'{}\' ]'.format(args.timeout))
+        else:
+            if int(args.timeout) < 1:
+                exit()
+            timeout_list = capture.getTimeouts(int(args.timeout))
+            title += 'Consecutive Timeout ' + str(args.timeout) + ' packets,'
+            lines += printOutages(timeout_list, '[ No Match on Timeout Value: \'{}\' ]'.format(args.timeout))
+
+    # Longest Outages (--top)
+    if args.top is not None:
+        print('\n // Longest Outages //')
+        if args.top < 1:
+            print('[ Error on Top Value: \'{}\' ]'.format(args.top))
+        else:
+            title += 'Top ' + str(args.top) + ' Outages,'
+            lines += printOutages(capture.getLongest(args.top), '[ No Outage ]')
+
+    # Outages overlapping a Seq Range (--range)
+    if args.range:
+        print('\n // Outages from Seq {} //'.format(args.range))
+        seq_range = re.findall(r'\d+', args.range)
+        if len(seq_range) != 2 or int(seq_range[0]) > int(seq_range[1]):
+            print('[ Error on Seq Range: \'{}\' ]'.format(args.range))
+        else:
+            title += 'Outages from Seq ' + args.range + ','
+            lines += printOutages(capture.getOverlapping(int(seq_range[0]), int(seq_range[1])),
+                                  '[ No Outage from Seq {} ]'.format(args.range))
+    stages.end(len(capture))
+
+    # Counts of Lost-Packets during a Time-Period (-c)
+    if args.count:
+        stages.begin('periods', filename)
+        print('\n // Lost-Packet Counts during a Time-Period //')
+        try:
+            time_period_values = list(map(int, re.split(r'\D+', args.count)))
+            time_periods = capture.getPacketsPerTimePeriod(time_period_values, args.sliding)
+            period_type = ' Sliding' if args.sliding else ''
+            if time_periods:
+                for time_period, v in time_periods.items():
+                    print('Per{} {} packets/seconds -- '.format(period_type, time_period))
+                    v = v[v[:, 2] > 0]
+                    print(''.join([' Seq {} to {} lost {} packets\n'.format(p1, p2, count) for p1, p2, count in v.tolist()]))
+                    title += '# of Incidents Per' + period_type + ' ' + str(time_period) + ' Packets,'
+                    sum_incident = len(v)
+                    max_packet_lost = int(v[:, 2].max()) if sum_incident else 0
+                    lines += '{} Incidents (Max {} packets lost),'.format(sum_incident, max_packet_lost)
+        except ValueError as e:
+            print('[ Error on Lost-Packet Count: {} ]'.format(e))        
+    stages.end(len(capture))
+
+    # Owner of the Target (--ip-index)
+    if args.ip_index:
+        stages.begin('ip-index', filename)
+        print('\n // Target //')
+        title += 'Target IP,ELB,Record Names,'
+        lines += annotateTarget(capture.address or readAddress(filename), args.ip_index)
+        stages.end(1)
+    lines += '\n'
+
+    # RTT sketch for -a and --save-sketch
+    file_sketch = None
+    if args.aggregate or args.save_sketch:
+        stages.begin('sketch', filename)
+        file_sketch = (capture.getSketch(), {'transmitted': capture.transmitted})
+        stages.end(len(capture.rtt))
+
+    # Time-bucketed history (--rollup)
+    if args.rollup:
+        stages.begin('rollup', filename)
+        rollupCapture(filename, capture.seq, capture.rtt, args)
+        stages.end(len(capture))
+
+    return title, lines, file_sketch
+
+
+'''
+Print the ELBs and record names that own the target address and return
+its CSV fields; several owners are separated by spaces
+'''
+def annotateTarget(address: str, ip_index: str) -> str:
+    if not address:
+        print('[ No target address found ]')
+        return ',,,'
+    print(' Address  {}'.format(address))
+    if not os.path.exists(ip_index):
+        print('[ Error on IP Index: no such file \'{}\' ]'.format(ip_index))
+        return address + ',,,'
+    try:
+        owners = lookupAddress(ip_index, address)
+    except Exception as e:
+        print('[ Error on IP Index: {} ]'.format(e))
+        return address + ',,,'
+    if not owners:
+        print('[ Not in IP Index: \'{}\' ]'.format(address))
+        return address + ',,,'
+    for elb, names, last_seen in owners:
+        print(' ELB      {} (last seen {})'.format(elb, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_seen))))
+        print(' Names    {}'.format(', '.join(names) or '-'))
+    names = dict.fromkeys(name for _, owner_names, _ in owners for name in owner_names)
+    return '{},{},{},'.format(address, ' '.join(elb for elb, _, _ in owners), ' '.join(names))
+
+
+'''
+Roll a capture into the minute and hour buckets of the rollup store. (--rollup)
+ping prints no timestamps, so packets are placed '--ping-interval' seconds
+apart from '--start-time', or from the file's modification time minus the
+duration of the capture.
+'''
+def rollupCapture(filename: str, seq, rtt_values, args):
+    import cache
+    import rollup
+    print('\n // Rollup //')
+    duration = (seq.max() - seq.min()) * args.ping_interval
+    try:
+        if args.start_time:
+            start_time = rollup.parse_time(args.start_time)
+        elif filename == '-':
+            start_time = time.time() - duration
+        else:
+            start_time = os.path.getmtime(filename) - duration
+        key = cache.get_key(filename) if filename != '-' else None
+        target = args.target or os.path.basename(filename)
+        written = rollup.ingest(args.rollup, target, seq, rtt_values, start_time, args.ping_interval, key, filename)
+    except (ValueError, OSError, rollup.sqlite3.Error) as e:
+        print('[ Error on Rollup: {} ]'.format(e))
+        return
+    if written:
+        print(' Added {} minute/hour buckets for \'{}\' to {}'.format(written, target, args.rollup))
+    else:
+        print('[ Already in {}: \'{}\' ]'.format(args.rollup, filename))
+
+
+'''
+Merge RTT sketches into an 'ALL' result. (-a)
+Counts, min, max, avg and stddev are exact; percentiles are within the
+relative accuracy of the sketch (1%).
+'''
+def aggregateSketches(sketches: dict, args) -> tuple:
+    import sketch
+    report = io.StringIO()
+    title = CSV_TITLE
+    lines = 'ALL,'
+    merged = sketch.DDSketch()
+    transmitted_packets = 0
+    for rtt_sketch, extra in sketches.values():
+        merged.merge(rtt_sketch)
+        transmitted_packets += extra.get('transmitted', rtt_sketch.count)
+    received_packets = merged.count
+    loss_packets = transmitted_packets - received_packets
+    packet_loss_rate = getPercentage(loss_packets, transmitted_packets) if transmitted_packets else 0.0
+
+    with contextlib.redirect_stdout(report):
+        print('------------------\n ALL \n------------------')
         print('\n // Packet Counts //')
         print(' Transmitted   {:6d} packets'.format(transmitted_packets))
         print(' Received      {:6d} packets'.format(received_packets))
@@ -273,82 +1248,121 @@ def main():
         lines += str(transmitted_packets) + ' packets,' + str(received_packets) + ' packets,' \
                 + str(loss_packets) + ' packets,' + '{:.2f}%'.format(packet_loss_rate) + ','
 
-        # RTT
         print('\n // Round-Trip Time //')
-        print(' Round-trip min    = {:9.3f} ms'.format(min(icmp.values())))
-        print(' Round-trip max    = {:9.3f} ms'.format(max(icmp.values())))
-        print(' Round-trip avg    = {:9.3f} ms'.format(sum(icmp.values()) / received_packets))
-        print(' Round-trip stddev = {:9.3f} ms'.format(statistics.stdev(icmp.values())))
-        lines += '{:.3f} ms,'.format(min(icmp.values())) + '{:.3f} ms,'.format(max(icmp.values())) \
-                + '{:.3f} ms,'.format(sum(icmp.values()) / received_packets) + '{:.3f} ms,'.format(statistics.stdev(icmp.values()))
-               
-        # Percentile Calculation (-p)
+        print(' Round-trip min    = {:9.3f} ms'.format(merged.min))
+        print(' Round-trip max    = {:9.3f} ms'.format(merged.max))
+        print(' Round-trip avg    = {:9.3f} ms'.format(merged.mean()))
+        print(' Round-trip stddev = {:9.3f} ms'.format(merged.stddev()))
+        lines += '{:.3f} ms,'.format(merged.min) + '{:.3f} ms,'.format(merged.max) \
+                + '{:.3f} ms,'.format(merged.mean()) + '{:.3f} ms,'.format(merged.stddev())
+
         if args.percentiles:
             print('\n // Percentiles //')
             try:
                 percentiles_values = list(map(int, re.split(r'\D+', args.percentiles)))
-                percentiles = getPercentiles(list(icmp.values()), percentiles_values)
-                if not percentiles:
-                    print('[ Error occured on calculating percentile! ]')
-                else:
-                    print(''.join(['{:3d}th Percentile is {:9.3f} ms\n'.format(percentile, value) for percentile, value in percentiles.items()]))
-                    title += ''.join(['{:3d}th Percentile,'.format(p) for p in percentiles.keys()])
-                    lines +=  ''.join(['{:.3f} ms,'.format(percentiles[p]) for p in percentiles.keys()])                    
+                percentiles = {p: merged.percentile(p) for p in percentiles_values}
+                print(''.join(['{:3d}th Percentile is {:9.3f} ms\n'.format(percentile, value) for percentile, value in percentiles.items()]))
+                title += ''.join(['{:3d}th Percentile,'.format(p) for p in percentiles.keys()])
+                lines +=  ''.join(['{:.3f} ms,'.format(percentiles[p]) for p in percentiles.keys()])
             except ValueError as e:
                 print('[ Error on Percentiles: {} ]'.format(e))
-
-        # Timeout Consecutively (-t)
-        if args.timeout:
-            print('\n // Consecutive Timeouts //')
-            if not args.timeout.isnumeric() or int(args.timeout) < 0 or int(args.timeout) >= max(icmp.keys()) -  min(icmp.keys()):
-                print('[ Error on Timeout Value: \'{}\' ]'.format(args.timeout))
-            else:
-                timeout_list = getTimeout(args.timeout, sorted(icmp.keys()))
-                title += 'Consecutive Timeout ' + str(args.timeout) + ' packets,'
-                if not timeout_list:
-                    print('[ No Match on Timeout Value: \'{}\' ]'.format(args.timeout))
-                    lines += 'No Match!,'
-                else:
-                    print(''.join([' Seq {} to {} : {:5d} packets lost\n'.format(p1, p2, p2 - p1 - 1) for p1, p2 in timeout_list]))
-                    lines += '"'
-                    lines += ''.join(['Seq {} to {} : {:d} packets lost\n'.format(p1, p2, p2 - p1 - 1) for p1, p2 in timeout_list])
-                    lines += '",'
-
-        # Counts of Lost-Packets during a Time-Period (-c)
-        if args.count:
-            print('\n // Lost-Packet Counts during a Time-Period //')
-            try:
-                time_period_values = list(map(int, re.split(r'\D+', args.count)))
-                time_periods = getPacketsPerTimePeriod(time_period_values, sorted(icmp.keys()))
-                if time_periods:
-                    for time_period, v in time_periods.items():
-                        print('Per {} packets/seconds -- '.format(time_period))
-                        print(''.join([' Seq {} to {} lost {} packets\n'.format(p1, p2, count) for p1, p2, count in v if count > 0]))
-                        title += '# of Incidents Per '+ str(time_period) + ' Packets,'
-                        sum_incident = max_packet_lost = 0
-                        for *p,count in v:
-                            if count > 0:
-                                sum_incident += 1
-                            if count > max_packet_lost:
-                                max_packet_lost = count
-                        lines += '{} Incidents (Max {} packets lost),'.format(sum_incident, max_packet_lost)
-            except ValueError as e:
-                print('[ Error on Lost-Packet Count: {} ]'.format(e))        
         lines += '\n'
 
+    return report.getvalue(), title, lines
+
+
+def main():
+    args = go_parser()
+    if args.follow:
+        if not args.filenames:
+            print('Error: please input the name of the file to follow, or \'-\' for STDIN.')
+            return
+        if args.timeout and (not args.timeout.isnumeric() or int(args.timeout) < 1):
+            print('[ Error on Timeout Value: \'{}\' ]'.format(args.timeout))
+            return
+        if args.window < 1 or args.interval <= 0:
+            print('[ Error on Window or Interval Value ]')
+            return
+        followCapture(args.filenames, int(args.timeout) if args.timeout else 0, args.interval, args.window)
+        return
+
+    if args.max_points < 0:
+        print('[ Error on Max Points Value: \'{}\' ]'.format(args.max_points))
+        return
+
+    output_filename = 'output.csv'
+    rtt_filename = 'rtt'
+    rtt = {}
+    lines = ''
+    title = ''
+
+    filenames = args.filenames.split(',') if args.filenames else []
+    if not filenames and not args.load_sketch:
+        print('Error: please input the name of the file(s) or use `--load-sketch`.')
+        return
+    sketches = {}
+    stages = profiler.StageProfiler(args.profile)
+    # STDIN can only be read by this process
+    if args.jobs > 1 and '-' not in filenames:
+        import concurrent.futures
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs)
+        results = executor.map(analyzeFile, filenames, itertools.repeat(args))
+    else:
+        executor = None
+        results = map(analyzeFile, filenames, itertools.repeat(args))
+
+    for filename, (report, file_title, file_lines, rtt_values, file_sketch, records) in zip(filenames, results):
+        title = title or file_title
+        print(report, end='')
+        stages.records += records
+        lines += file_lines
         # for RTT Graph
-        rtt[filename] = list(icmp.values())
+        rtt[filename] = rtt_values
+        if file_sketch:
+            sketches[filename] = file_sketch
+    if executor:
+        executor.shutdown()
+
+    # Save and merge RTT sketches (--save-sketch, --load-sketch, -a)
+    if args.save_sketch or args.load_sketch:
+        import sketch
+    if args.save_sketch:
+        sketch.save_sketches(sketches, args.save_sketch)
+    if args.load_sketch:
+        for sketch_filename in args.load_sketch.split(','):
+            for name, loaded in sketch.load_sketches(sketch_filename).items():
+                sketches[sketch_filename + ':' + name] = loaded
+    if args.aggregate and sketches:
+        stages.begin('aggregate')
+        report, all_title, all_lines = aggregateSketches(sketches, args)
+        stages.end(len(sketches))
+        print(report, end='')
+        title = title or all_title
+        lines += all_lines
 
     # Output to a CSV file
     if args.output:
         output_filename = args.output
-    output_to_file(title + '\n' + lines, output_filename)
+    stages.begin('output')
+    output_to_file((title or CSV_TITLE) + '\n' + lines, output_filename)
+    stages.end(lines.count('\n'))
 
     # Output RTT and its graph to a CSV and a HTML file
     if args.graph:
         rtt_filename = args.graph
-    convert_to_CSV(rtt, rtt_filename)
-    getGraph(rtt, rtt_filename)
+    if rtt and not args.no_graph:
+        rtt_rows = sum(len(values) for values in rtt.values())
+        stages.begin('csv')
+        convert_to_CSV(rtt, rtt_filename)
+        stages.end(rtt_rows)
+        stages.begin('graph')
+        getGraph(rtt, rtt_filename, args.max_points)
+        stages.end(rtt_rows)
+
+    # Per-stage profile (--profile, --profile-json)
+    stages.report()
+    if args.profile and args.profile_json:
+        stages.save(args.profile_json)
 
 
 if __name__ == '__main__':
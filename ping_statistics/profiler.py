@@ -0,0 +1,91 @@
+'''
+Per-stage profiling for ping_statistics.py (--profile).
+
+Each stage records its wall time, CPU time, tracemalloc peak, the peak RSS
+of the process so far and the rows/bytes it processed. A disabled profiler
+does nothing, so the stages can be marked unconditionally.
+
+tracemalloc slows down allocation-heavy stages such as parsing, so wall and
+CPU times under --profile are somewhat higher than in a normal run.
+The peak RSS comes from the POSIX `resource` module; it is left out where
+that is missing (Windows).
+'''
+import sys
+import json
+import time
+import tracemalloc
+
+
+'''
+Peak RSS of the process in bytes, or None without the `resource` module
+'''
+def getPeakRSS():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.records = []
+        self.current = None
+
+    def begin(self, stage: str, filename: str = '*'):
+        if not self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.current = {'file': filename, 'stage': stage,
+                        'wall_start': time.perf_counter(), 'cpu_start': time.process_time()}
+
+    def end(self, rows: int = None, input_bytes: int = None):
+        if not self.enabled or not self.current:
+            return
+        record = self.current
+        record['wall_s'] = time.perf_counter() - record.pop('wall_start')
+        record['cpu_s'] = time.process_time() - record.pop('cpu_start')
+        record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        record['peak_rss_bytes'] = getPeakRSS()
+        record['rows'] = rows
+        record['input_bytes'] = input_bytes
+        self.records.append(record)
+        self.current = None
+
+    '''
+    Print the records to stderr, with the stage that took the most time
+    '''
+    def report(self):
+        if not self.enabled or not self.records:
+            return
+        print('\n // Profile //', file=sys.stderr)
+        print(' {:<24} {:<12} {:>9} {:>9} {:>11} {:>11} {:>10} {:>12}'.format(
+            'File', 'Stage', 'Wall (s)', 'CPU (s)', 'Peak (MB)', 'RSS (MB)', 'Rows', 'Bytes'), file=sys.stderr)
+        for r in self.records:
+            print(' {:<24} {:<12} {:9.4f} {:9.4f} {:11.1f} {:>11} {:>10} {:>12}'.format(
+                r['file'][-24:], r['stage'], r['wall_s'], r['cpu_s'], r['peak_traced_bytes'] / 1024 / 1024,
+                '-' if r['peak_rss_bytes'] is None else '{:.1f}'.format(r['peak_rss_bytes'] / 1024 / 1024),
+                '-' if r['rows'] is None else r['rows'], '-' if r['input_bytes'] is None else r['input_bytes']),
+                file=sys.stderr)
+
+        totals = {}
+        for r in self.records:
+            totals[r['stage']] = totals.get(r['stage'], 0.0) + r['wall_s']
+        total = sum(totals.values())
+        stage, wall = max(totals.items(), key=lambda item: item[1])
+        print(' Total {:.4f} s; most time in \'{}\': {:.4f} s ({:.1f}%)'.format(
+            total, stage, wall, wall / total * 100 if total else 0.0), file=sys.stderr)
+
+    def save(self, filename: str) -> bool:
+        try:
+            with open(filename, 'w') as f:
+                json.dump({'records': self.records}, f, indent=2)
+        except OSError as e:
+            print(e)
+            return False
+        return True
@@ -0,0 +1,288 @@
+'''
+Time-bucketed rollup store for ping history, in a local SQLite file.
+
+Features:
+1. Ingest (ping_statistics.py --rollup [db])
+    1) Every analyzed capture is rolled into per-minute and per-hour buckets.
+    2) Each bucket keeps sent, received, lost, min, max, sum and sum of squares
+       of the RTT, and a DDSketch histogram (1% relative accuracy) for percentiles.
+    3) ping output has no timestamps: packet seq N is placed at
+       start + (N - first seq) * interval, with the start time given by
+       '--start-time', or else the file's modification time minus the capture duration.
+    4) A capture is ingested only once (same path, size, mtime and sampled content).
+2. Query (Run As: $ rollup.py [db] --from 2024-03-01 --to 2024-03-08 -p 50,99)
+    1) Loss rate, RTT min/avg/max/stddev and percentiles over any time range,
+       from hour buckets where whole hours are covered and minute buckets at the edges.
+    2) '--target' limits the query to one capture target (default: all).
+    3) '--per minute|hour' lists every bucket in the range instead of one total.
+'''
+import json
+import math
+import time
+import sqlite3
+import argparse
+import datetime
+import numpy
+import sketch
+
+RESOLUTIONS = {'minute': 60, 'hour': 3600}
+HIST_ACCURACY = 0.01
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rollup (
+    resolution INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    sent INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    lost INTEGER NOT NULL,
+    rtt_min REAL,
+    rtt_max REAL,
+    rtt_sum REAL NOT NULL,
+    rtt_sumsq REAL NOT NULL,
+    hist TEXT NOT NULL,
+    PRIMARY KEY (resolution, target, bucket)
+);
+CREATE TABLE IF NOT EXISTS captures (
+    key TEXT PRIMARY KEY,
+    filename TEXT,
+    target TEXT,
+    start REAL,
+    end REAL,
+    ingested REAL
+);
+'''
+
+
+def go_parser():
+    parser = argparse.ArgumentParser(description = 'Query the ping rollup store')
+    parser.add_argument('db',
+                        help = 'Input the name of the rollup SQLite file.')
+    parser.add_argument('--from', action = 'store', dest = 'start', required = True,
+                        help = 'Input the start of the time range, as epoch seconds or YYYY-MM-DD[THH:MM[:SS]] local time')
+    parser.add_argument('--to', action = 'store', dest = 'end', required = True,
+                        help = 'Input the end of the time range (exclusive), in the same format as --from')
+    parser.add_argument('--target', action = 'store', dest = 'target',
+                        help = 'Input the target to query (default is all targets)')
+    parser.add_argument('-p', '--percentiles', action = 'store', dest = 'percentiles',
+                        help = 'Input value(s) (0-100), sepearted by \',\' if there is more than one value.')
+    parser.add_argument('--per', action = 'store', dest = 'per', choices = sorted(RESOLUTIONS),
+                        help = 'List every minute or hour bucket in the range instead of one total')
+    args = parser.parse_args()
+    try:
+        args.percentiles = [int(p) for p in args.percentiles.split(',')] if args.percentiles else []
+    except ValueError:
+        parser.error('argument -p/--percentiles: invalid value: \'{}\''.format(args.percentiles))
+    out_of_range = [p for p in args.percentiles if p < 0 or p > 100]
+    if out_of_range:
+        parser.error('argument -p/--percentiles: values must be in the range 0-100: {}'.format(
+            ','.join(map(str, out_of_range))))
+    return args
+
+
+'''
+Parse epoch seconds or an ISO 8601 date/time in local time
+'''
+def parse_time(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def connect(db: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db, timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+'''
+Roll a capture into minute and hour buckets.
+seq and rtt are the replies of the capture; every seq from the first to the
+last reply counts as sent. Returns the number of buckets written, or 0 if
+the capture (by key) was ingested before.
+'''
+def ingest(db: str, target: str, seq, rtt, start_time: float, interval: float = 1.0,
+           key: str = None, filename: str = None) -> int:
+    seq = numpy.asarray(seq, dtype=numpy.int64)
+    rtt = numpy.asarray(rtt, dtype=numpy.float64)
+    if not seq.size:
+        return 0
+    order = numpy.argsort(seq, kind='stable')
+    seq, rtt = seq[order], rtt[order]
+    first_seq = seq[0]
+    end_time = start_time + (seq[-1] - first_seq) * interval
+
+    conn = connect(db)
+    try:
+        with conn:
+            if key:
+                if conn.execute('SELECT 1 FROM captures WHERE key = ?', (key,)).fetchone():
+                    return 0
+                conn.execute('INSERT INTO captures VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, filename, target, start_time, end_time, time.time()))
+            written = 0
+            for resolution in RESOLUTIONS.values():
+                for row in get_buckets(seq, rtt, first_seq, start_time, interval, resolution):
+                    merge_row(conn, resolution, target, row)
+                    written += 1
+    finally:
+        conn.close()
+    return written
+
+
+'''
+Compute the bucket rows of one resolution for seq-sorted replies
+'''
+def get_buckets(seq, rtt, first_seq: int, start_time: float, interval: float, resolution: int) -> list:
+    sent_buckets = numpy.floor((start_time + numpy.arange(seq[-1] - first_seq + 1) * interval) / resolution).astype(numpy.int64)
+    first_bucket = sent_buckets[0]
+    sent = numpy.bincount(sent_buckets - first_bucket)
+    index = numpy.floor((start_time + (seq - first_seq) * interval) / resolution).astype(numpy.int64) - first_bucket
+    received = numpy.bincount(index, minlength=sent.size)
+    rtt_sum = numpy.bincount(index, weights=rtt, minlength=sent.size)
+    rtt_sumsq = numpy.bincount(index, weights=rtt * rtt, minlength=sent.size)
+    # index is sorted, so each bucket is one run of it
+    present, starts = numpy.unique(index, return_index=True)
+    rtt_min = dict(zip(present.tolist(), numpy.minimum.reduceat(rtt, starts).tolist()))
+    rtt_max = dict(zip(present.tolist(), numpy.maximum.reduceat(rtt, starts).tolist()))
+
+    hist = {}
+    positive = rtt > 0
+    keys = sketch.DDSketch(HIST_ACCURACY).getKeys(rtt[positive])
+    if keys.size:
+        key_min = keys.min()
+        span = keys.max() - key_min + 1
+        # one (bucket, key) pair per distinct value of bucket * span + key
+        pairs, counts = numpy.unique(index[positive] * span + (keys - key_min), return_counts=True)
+        for pair, count in zip(pairs.tolist(), counts.tolist()):
+            bucket, key = divmod(pair, span)
+            hist.setdefault(bucket, {'bins': {}, 'zero_count': 0})['bins'][str(key + key_min)] = count
+    for bucket, count in zip(*numpy.unique(index[~positive], return_counts=True)):
+        hist.setdefault(int(bucket), {'bins': {}, 'zero_count': 0})['zero_count'] = int(count)
+
+    rows = []
+    for i in numpy.flatnonzero(sent).tolist():
+        rows.append((int(first_bucket + i) * resolution, int(sent[i]), int(received[i]),
+                     rtt_min.get(i), rtt_max.get(i), float(rtt_sum[i]), float(rtt_sumsq[i]),
+                     hist.get(i, {'bins': {}, 'zero_count': 0})))
+    return rows
+
+
+def merge_row(conn: sqlite3.Connection, resolution: int, target: str, row: tuple):
+    bucket, sent, received, rtt_min, rtt_max, rtt_sum, rtt_sumsq, hist = row
+    old = conn.execute('SELECT sent, received, rtt_min, rtt_max, rtt_sum, rtt_sumsq, hist FROM rollup '
+                       'WHERE resolution = ? AND target = ? AND bucket = ?', (resolution, target, bucket)).fetchone()
+    if old:
+        sent += old[0]
+        received += old[1]
+        rtt_min = min(v for v in (rtt_min, old[2]) if v is not None) if received else None
+        rtt_max = max(v for v in (rtt_max, old[3]) if v is not None) if received else None
+        rtt_sum += old[4]
+        rtt_sumsq += old[5]
+        old_hist = json.loads(old[6])
+        for key, count in old_hist['bins'].items():
+            hist['bins'][key] = hist['bins'].get(key, 0) + count
+        hist['zero_count'] += old_hist['zero_count']
+    conn.execute('INSERT OR REPLACE INTO rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                 (resolution, target, bucket, sent, received, sent - received,
+                  rtt_min, rtt_max, rtt_sum, rtt_sumsq, json.dumps(hist)))
+
+
+'''
+Merge rows of the rollup table into totals and an RTT sketch
+'''
+def merge_rows(rows) -> dict:
+    result = {'sent': 0, 'received': 0, 'lost': 0, 'sketch': sketch.DDSketch(HIST_ACCURACY)}
+    for sent, received, lost, rtt_min, rtt_max, rtt_sum, rtt_sumsq, hist in rows:
+        result['sent'] += sent
+        result['received'] += received
+        result['lost'] += lost
+        if not received:
+            continue
+        hist = json.loads(hist)
+        result['sketch'].merge(sketch.DDSketch.fromDict({
+            'relative_accuracy': HIST_ACCURACY, 'bins': hist['bins'], 'zero_count': hist['zero_count'],
+            'count': received, 'sum': rtt_sum, 'sumsq': rtt_sumsq, 'min': rtt_min, 'max': rtt_max}))
+    return result
+
+
+'''
+Query the totals of [start, end), using hour buckets for the whole hours
+and minute buckets for the partial hours at both ends
+'''
+def query(db: str, start: float, end: float, target: str = None) -> dict:
+    minute, hour = RESOLUTIONS['minute'], RESOLUTIONS['hour']
+    start = math.floor(start / minute) * minute
+    end = math.ceil(end / minute) * minute
+    hour_start = math.ceil(start / hour) * hour
+    hour_end = math.floor(end / hour) * hour
+    if hour_start < hour_end:
+        ranges = [(minute, start, hour_start), (hour, hour_start, hour_end), (minute, hour_end, end)]
+    else:
+        ranges = [(minute, start, end)]
+
+    sql = ('SELECT sent, received, lost, rtt_min, rtt_max, rtt_sum, rtt_sumsq, hist FROM rollup '
+           'WHERE resolution = ? AND bucket >= ? AND bucket < ?')
+    conn = connect(db)
+    try:
+        rows = []
+        for resolution, range_start, range_end in ranges:
+            if target:
+                rows += conn.execute(sql + ' AND target = ?', (resolution, range_start, range_end, target)).fetchall()
+            else:
+                rows += conn.execute(sql, (resolution, range_start, range_end)).fetchall()
+    finally:
+        conn.close()
+    return merge_rows(rows)
+
+
+'''
+Query every bucket of a resolution in [start, end), as {bucket start: totals}
+'''
+def query_buckets(db: str, start: float, end: float, resolution: int, target: str = None) -> dict:
+    sql = ('SELECT bucket, sent, received, lost, rtt_min, rtt_max, rtt_sum, rtt_sumsq, hist FROM rollup '
+           'WHERE resolution = ? AND bucket >= ? AND bucket < ?')
+    params = [resolution, math.floor(start / resolution) * resolution, end]
+    if target:
+        sql += ' AND target = ?'
+        params.append(target)
+    conn = connect(db)
+    try:
+        grouped = {}
+        for bucket, *row in conn.execute(sql + ' ORDER BY bucket', params):
+            grouped.setdefault(bucket, []).append(row)
+    finally:
+        conn.close()
+    return {bucket: merge_rows(rows) for bucket, rows in grouped.items()}
+
+
+def format_result(result: dict, percentiles: list) -> str:
+    rtt_sketch = result['sketch']
+    text = 'Sent {:d} Received {:d} Lost {:d} ({:.2f}%)'.format(
+        result['sent'], result['received'], result['lost'],
+        result['lost'] / result['sent'] * 100 if result['sent'] else 0.0)
+    if rtt_sketch.count:
+        text += ' | RTT min/avg/max/stddev = {:.3f}/{:.3f}/{:.3f}/{:.3f} ms'.format(
+            rtt_sketch.min, rtt_sketch.mean(), rtt_sketch.max, rtt_sketch.stddev())
+        if percentiles:
+            text += ' | ' + ' '.join(['p{}={:.3f}'.format(p, rtt_sketch.percentile(p)) for p in percentiles])
+    return text
+
+
+def main():
+    args = go_parser()
+    start, end = parse_time(args.start), parse_time(args.end)
+
+    if args.per:
+        for bucket, result in query_buckets(args.db, start, end, RESOLUTIONS[args.per], args.target).items():
+            print(' {} {}'.format(datetime.datetime.fromtimestamp(bucket).strftime('%Y-%m-%d %H:%M'),
+                                  format_result(result, args.percentiles)))
+    else:
+        print(' {} to {}: {}'.format(datetime.datetime.fromtimestamp(start).isoformat(),
+                                     datetime.datetime.fromtimestamp(end).isoformat(),
+                                     format_result(query(args.db, start, end, args.target), args.percentiles)))
+
+
+if __name__ == '__main__':
+    main()
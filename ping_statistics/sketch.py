@@ -0,0 +1,163 @@
+'''
+DDSketch - a mergeable quantile sketch for round-trip times.
+
+Values are counted in logarithmic buckets: bucket i holds values in
+(gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), where a is the
+relative accuracy. Any quantile returned is within a relative error of a
+(default 1%) of the exact value of that rank, e.g. a true p99 of 200 ms is
+reported between 198 ms and 202 ms.
+
+The number of buckets grows with the log of max/min RTT, not with the
+number of values; it is capped at max_buckets by collapsing the lowest
+buckets, which only affects the accuracy of the lowest quantiles.
+
+Sketches with the same relative accuracy merge exactly, and are saved as
+JSON so that daily results can be combined without the raw captures.
+Count, sum, sum of squares, min and max are kept exactly alongside.
+'''
+import json
+import math
+import numpy
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64).ravel()
+        if not values.size:
+            return
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.sumsq += float(numpy.dot(values, values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += int(values.size - positive.size)
+        keys, counts = numpy.unique(self.getKeys(positive), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.collapse()
+
+    # bucket index of each positive value
+    def getKeys(self, values) -> numpy.ndarray:
+        return numpy.ceil(numpy.log(values) / self.log_gamma).astype(numpy.int64)
+
+    def merge(self, other: 'DDSketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('cannot merge sketches with different relative accuracy')
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.collapse()
+
+    def collapse(self):
+        if len(self.bins) <= self.max_buckets:
+            return
+        keys = sorted(self.bins)
+        overflow = keys[:len(keys) - self.max_buckets + 1]
+        self.bins[overflow[-1]] = sum(self.bins.pop(key) for key in overflow[:-1]) + self.bins[overflow[-1]]
+
+    '''
+    Return the value at percentile p (0-100), or None for an empty sketch
+    '''
+    def percentile(self, p: float):
+        if not self.count:
+            return None
+        if p < 0 or p > 100:
+            raise ValueError('percentiles must be in the range [0, 100]')
+        rank = p / 100 * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                # the exact extremes are known
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def stddev(self) -> float:
+        if self.count < 2:
+            return math.nan
+        variance = (self.sumsq - self.sum * self.sum / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def toDict(self) -> dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'bins': {str(key): count for key, count in sorted(self.bins.items())},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'sumsq': self.sumsq,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def fromDict(cls, obj: dict) -> 'DDSketch':
+        sketch = cls(obj['relative_accuracy'], obj.get('max_buckets', 2048))
+        sketch.bins = {int(key): count for key, count in obj['bins'].items()}
+        sketch.zero_count = obj['zero_count']
+        sketch.count = obj['count']
+        sketch.sum = obj['sum']
+        sketch.sumsq = obj['sumsq']
+        if sketch.count:
+            sketch.min = obj['min']
+            sketch.max = obj['max']
+        return sketch
+
+
+'''
+Save sketches with extra per-sketch fields (e.g. packet counts) to a JSON file
+'''
+def save_sketches(sketches: dict, filename: str) -> bool:
+    try:
+        with open(filename, 'w') as f:
+            json.dump({name: dict(extra, sketch=sketch.toDict()) for name, (sketch, extra) in sketches.items()}, f)
+    except OSError as e:
+        print(e)
+        return False
+    return True
+
+
+'''
+Load sketches saved by save_sketches, as {name: (sketch, extra fields)}
+'''
+def load_sketches(filename: str) -> dict:
+    try:
+        with open(filename) as f:
+            obj = json.load(f)
+    except (OSError, ValueError) as e:
+        print(e)
+        return {}
+    sketches = {}
+    for name, record in obj.items():
+        record = dict(record)
+        sketches[name] = (DDSketch.fromDict(record.pop('sketch')), record)
+    return sketches
@@ -0,0 +1,62 @@
+'''
+Tests of collector.py with a stub ping command (--ping-command).
+
+Run As: $ python -m pytest ping_statistics
+'''
+import os
+import sys
+import subprocess
+
+COLLECTOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'collector.py')
+
+# replies to 'up' targets with icmp_seq 2 lost, only timeouts to 'down' targets,
+# and fails like ping on unknown hosts
+STUB_PING = '''#!{python}
+import sys
+args = sys.argv[1:]
+count = int(args[args.index('-c') + 1])
+host = args[-1]
+if host.startswith('bad'):
+    print('ping: {{}}: Name or service not known'.format(host))
+    sys.exit(2)
+print('PING {{0}} ({{0}}): 56 data bytes'.format(host))
+for seq in range(count):
+    if host.startswith('down') or seq == 2:
+        print('Request timeout for icmp_seq {{}}'.format(seq))
+    else:
+        print('64 bytes from {{}}: icmp_seq={{}} ttl=64 time={{:.3f}} ms'.format(host, seq, 10.0 + seq))
+'''
+
+
+def runCollector(tmp_path, targets: str, *options) -> tuple:
+    stub = tmp_path / 'ping'
+    stub.write_text(STUB_PING.format(python=sys.executable))
+    stub.chmod(0o755)
+    output = tmp_path / 'output.csv'
+    command = [sys.executable, COLLECTOR, targets, '--ping-command', str(stub), '-n', '5', '-i', '0.01',
+               '--refresh', '60', '-o', str(output)] + list(options)
+    report = subprocess.run(command, cwd=os.path.dirname(COLLECTOR), capture_output=True, text=True, timeout=60)
+    assert report.returncode == 0, report.stderr
+    rows = output.read_text().splitlines() if output.exists() else []
+    return report.stdout, rows
+
+
+def test_report_per_target(tmp_path):
+    report, rows = runCollector(tmp_path, 'up1,up2', '-p', '50')
+    assert ' up1 ' in report and ' up2 ' in report
+    assert rows[0].endswith(' 50th Percentile,')
+    assert rows[1].startswith('up1,5 packets,4 packets,1 packets,20.00%,10.000 ms,14.000 ms,')
+    assert rows[2].startswith('up2,')
+
+
+def test_header_from_first_target_with_data(tmp_path):
+    _, rows = runCollector(tmp_path, 'up1,down1', '-p', '50', '--top', '1')
+    assert rows[0].endswith(' 50th Percentile,Top 1 Outages,')
+    assert rows[-1] == 'down1,'
+
+
+def test_failed_ping_is_reported(tmp_path):
+    report, rows = runCollector(tmp_path, 'bad1,up1')
+    assert 'bad1: ping exited with 2: ping: bad1: Name or service not known' in report
+    assert rows[1] == 'bad1,'
+    assert rows[2].startswith('up1,5 packets,')